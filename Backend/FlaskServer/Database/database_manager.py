@@ -1,3 +1,5 @@
+from migrations import migrate, analyze, schema_version
+import argparse
 import sqlite3
 
 conn = sqlite3.connect('./user_data.sqlite')
@@ -78,7 +80,22 @@ def retrieve_user_class_data(username, class_name):
     return rows
 
 if __name__ == '__main__':
-    retrieve_data()
+    parser = argparse.ArgumentParser(description="Inspect and maintain user_data.sqlite (run from this folder).")
+    parser.add_argument('--migrate', action='store_true', help='apply pending schema migrations')
+    parser.add_argument('--analyze', action='store_true', help='refresh the query planner statistics')
+    args = parser.parse_args()
+
+    if args.migrate or args.analyze:
+        if args.migrate:
+            applied = migrate(conn)
+            if not applied:
+                print("Schema already up to date")
+        if args.analyze:
+            analyze(conn)
+            print("Statistics updated")
+        print(f"Schema version: {schema_version(conn)}")
+    else:
+        retrieve_data()
 
 cursor.close()
 conn.close()
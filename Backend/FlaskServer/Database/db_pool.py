@@ -0,0 +1,102 @@
+"""
+Pooled SQLite connections shared by the backend (Backend/FlaskServer/app.py) and the
+teacher dashboard (WebsiteDashboard/app.py).
+
+Opening a connection per request throws away SQLite's page cache and every prepared
+statement each time. Here connections are opened once, tuned, and handed from request
+to request instead:
+
+    db_pool = ConnectionPool(DATABASE)
+
+    def get_db():
+        if 'db' not in g:
+            g.db = db_pool.acquire()
+        return g.db
+
+    @app.teardown_appcontext
+    def close_connection(exception):
+        db = g.pop('db', None)
+        if db is not None:
+            db_pool.release(db)
+"""
+from dotenv import load_dotenv
+import os
+import queue
+import sqlite3
+
+load_dotenv()
+
+# idle connections kept per database file; extra ones are closed when released
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+# bytes of the database file read through a memory map instead of read() calls
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))
+# page cache per connection, in KiB
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', str(16 * 1024)))
+# prepared statements each connection keeps compiled
+DB_CACHED_STATEMENTS = int(os.getenv('DB_CACHED_STATEMENTS', '256'))
+# how long a writer waits for another process's write lock before failing
+DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', '10'))
+
+
+def connect(path):
+    """
+    Opens a tuned connection:
+
+    - WAL journal, so the dashboard's reads and finish_test's writes no longer block each other;
+    - synchronous=NORMAL, which is durable across application crashes in WAL mode and
+      skips an fsync per commit;
+    - mmap_size and cache_size so hot pages stay in memory between requests;
+    - a larger statement cache, so repeated queries skip the SQL compiler.
+
+    Rows come back as sqlite3.Row for dict-like access in templates and JSON.
+    """
+    db = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT, check_same_thread=False,
+                         cached_statements=DB_CACHED_STATEMENTS)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL;")
+    db.execute("PRAGMA synchronous=NORMAL;")
+    db.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE};")
+    db.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB};")
+    db.execute("PRAGMA temp_store=MEMORY;")
+    return db
+
+
+class ConnectionPool:
+    """
+    Reusable connections to one database file. A connection is used by one thread at a
+    time: a request acquires it, uses it, and releases it in teardown, after which any
+    other thread may pick it up, so the pool works whether the server keeps a fixed set
+    of worker threads or starts a thread per request.
+    """
+
+    def __init__(self, path, max_idle=DB_POOL_SIZE):
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+
+    def acquire(self):
+        """
+        Returns an idle connection, or opens a new one if all are in use.
+        """
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return connect(self.path)
+
+    def release(self, db):
+        """
+        Hands a connection back. Anything it left uncommitted is rolled back so the next
+        user starts clean.
+        """
+        try:
+            if db.in_transaction:
+                db.rollback()
+            self._idle.put_nowait(db)
+        except (queue.Full, sqlite3.Error):
+            db.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
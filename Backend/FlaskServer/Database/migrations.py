@@ -0,0 +1,143 @@
+"""
+Versioned schema for user_data.sqlite.
+
+Each migration is applied once, in order, inside its own transaction, and the database
+remembers how far it has got in PRAGMA user_version. To change the schema, append a new
+(version, description, statements) entry; never edit one that has already shipped.
+
+    python database_manager.py --migrate --analyze
+"""
+import sqlite3
+
+MIGRATIONS = [
+    (1, "baseline schema", [
+        # matches the tables that were created by hand in the checked-in database
+        """
+        CREATE TABLE IF NOT EXISTS data (
+            test_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT,
+            class TEXT,
+            question1 TEXT,
+            question2 TEXT,
+            question3 TEXT,
+            question4 TEXT,
+            question5 TEXT,
+            spelling_accuracy REAL,
+            stutter_metric TEXT,
+            speaking_accuracy TEXT,
+            handwriting_metric REAL,
+            total_score REAL,
+            difficulty_level INTEGER
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS learning (
+            question_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            path_to_audio_t1 TEXT,
+            path_to_audio_t2 TEXT,
+            t1_answer TEXT,
+            t2_answer TEXT
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS learning_questions (
+            question_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question_type TEXT,
+            question_audio_path TEXT,
+            question_text TEXT,
+            question_difficulty INTEGER
+        );
+        """,
+    ]),
+    (2, "indexes for the read paths", [
+        # WHERE username = ? (retrieve_user_data, user_dashboard) and
+        # WHERE username = ? AND class = ? (retrieve_user_class_data)
+        "CREATE INDEX IF NOT EXISTS idx_data_username_class ON data (username, class);",
+        # SELECT DISTINCT username ... WHERE class = ? (dashboard index), answered from the index alone
+        "CREATE INDEX IF NOT EXISTS idx_data_class_username ON data (class, username);",
+        # WHERE question_difficulty = ? (retrieve_learning_questions)
+        "CREATE INDEX IF NOT EXISTS idx_learning_questions_difficulty ON learning_questions (question_difficulty);",
+    ]),
+    (3, "users table for per-student attributes", [
+        # one row per student, so a difficulty change is a single-row write instead of
+        # rewriting their whole test history; data.difficulty_level is now only a record
+        # of the difficulty each test was taken at
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            class TEXT,
+            difficulty_level INTEGER NOT NULL DEFAULT 0
+        );
+        """,
+        # difficulty was read from a student's first test row, class is taken from their latest
+        """
+        INSERT OR IGNORE INTO users (username, class, difficulty_level)
+        SELECT first.username,
+               (SELECT latest.class FROM data latest WHERE latest.username = first.username
+                ORDER BY latest.test_id DESC LIMIT 1),
+               COALESCE(first.difficulty_level, 0)
+        FROM data first
+        WHERE first.username IS NOT NULL
+          AND first.test_id = (SELECT MIN(test_id) FROM data WHERE username = first.username);
+        """,
+    ]),
+    (4, "username index that also serves ORDER BY test_id", [
+        # (username, class) put class before the rowid, so WHERE username = ? ORDER BY test_id
+        # needed a temp b-tree to sort; username AND class lookups use idx_data_class_username
+        "DROP INDEX IF EXISTS idx_data_username_class;",
+        # implicitly ends in the rowid (test_id), so it covers both the filter and the sort
+        "CREATE INDEX IF NOT EXISTS idx_data_username ON data (username);",
+    ]),
+]
+
+
+def schema_version(db):
+    return db.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def migrate(db):
+    """
+    Applies every migration newer than the database's user_version.
+
+    :param db: An open sqlite3 connection.
+    :return: List of (version, description) pairs that were applied.
+    """
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version <= schema_version(db):
+            continue
+        try:
+            db.execute("BEGIN IMMEDIATE;")
+            # re-check under the write lock in case another process migrated meanwhile
+            if version <= schema_version(db):
+                db.rollback()
+                continue
+            for statement in statements:
+                db.execute(statement)
+            db.execute(f"PRAGMA user_version = {version};")
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        applied.append((version, description))
+        print(f"Applied migration {version}: {description}")
+    return applied
+
+
+def analyze(db):
+    """
+    Refreshes the statistics the query planner uses to pick indexes.
+    """
+    db.execute("ANALYZE;")
+    db.commit()
+
+
+def migrate_database(path):
+    """
+    Opens the database at path, migrates it and closes it again.
+    """
+    db = sqlite3.connect(path, timeout=10)
+    try:
+        return migrate(db)
+    finally:
+        db.close()
@@ -1,17 +1,26 @@
-from flask import Flask, request, send_file, jsonify, g, url_for
-from text_to_speech import create_audio
-from speech_to_text import transcribe_audio
-from data.words import QUESTION_ONE_WORDS, QUESTION_THREE_WORDS, QUESTION_FOUR_WORDS, QUESTION_FIVE_PHRASES
+from flask import Flask, Response, request, send_file, jsonify, g, url_for
+from text_to_speech import TTS_STREAMING, cached_audio, create_audio, prefetch_audio, stream_audio
+from speech_to_text import get_transcriber, transcribe_audio
+from data.words import QUESTION_ONE_WORDS, QUESTION_TWO_LETTERS, QUESTION_THREE_WORDS, QUESTION_FOUR_WORDS, QUESTION_FIVE_PHRASES
 from models.modelV1 import StutterCNN
-from image_rec import handwriting_test
+from model_registry import get_stutter_model, predict_stutter_batched, score_stutter_windows
+from image_rec import get_handwriting_grader, grade_handwriting
+from prerender_audio import start_prerender_in_background
+from session_store import create_session_store
+from vendor_calls import ServiceError, ServiceTimeout, ServiceUnavailable
+from uploads import spool_upload, upload_filename
+from result_cache import ResultCache
+from Database.db_pool import ConnectionPool
+from Database.migrations import migrate_database
 from dotenv import load_dotenv
+from werkzeug.datastructures import FileStorage
+from concurrent.futures import ThreadPoolExecutor
+import io
 import os
 import random
-import pandas as pd
-import sqlite3
-import torch
-from pydub import AudioSegment
-import re
+import secrets
+import time
+from audio_decode import lead_samples, prepare_speech
 
 # loading env vars
 load_dotenv()
@@ -20,25 +29,55 @@ app = Flask(__name__, static_folder='static')
 
 DIFFICULTY_LEVELS = ["easy", "medium", "hard"]
 TTS_FOLDER = os.path.join(app.root_path, 'static/tts')
-STT_FOLDER = os.path.join(app.root_path, 'static/stt')
+
+# "first_window" only scores the first ~3 seconds of question four audio,
+# "windowed" scores the whole clip (up to STUTTER_MAX_SECONDS) as overlapping windows
+STUTTER_SCORING_MODE = os.getenv('STUTTER_SCORING_MODE', 'first_window')
+STUTTER_MAX_SECONDS = float(os.getenv('STUTTER_MAX_SECONDS', '30'))
+# question four verdicts remembered per recording, 0 disables the cache
+stutter_cache = ResultCache(int(os.getenv('STUTTER_CACHE_MAX_ENTRIES', '1024')))
+
+# slow grading routes (question three, four and five) can answer 202 straight away and
+# grade on this pool; finish_test waits up to GRADING_WAIT_SECONDS for outstanding jobs
+GRADING_ASYNC = os.getenv('GRADING_ASYNC', '0') == '1'
+GRADING_WORKERS = int(os.getenv('GRADING_WORKERS', '4'))
+GRADING_WAIT_SECONDS = float(os.getenv('GRADING_WAIT_SECONDS', '60'))
+grading_executor = ThreadPoolExecutor(max_workers=GRADING_WORKERS, thread_name_prefix='grading')
+
+# load the stutter model once per process instead of on every question four request
+get_stutter_model()
+# same for the speech-to-text and handwriting models when they run locally
+get_transcriber()
+get_handwriting_grader()
+
+# render every question prompt in the background so the first student never waits on TTS
+if os.getenv('TTS_PRERENDER_ON_STARTUP', '0') == '1':
+    start_prerender_in_background(workers=int(os.getenv('TTS_PRERENDER_WORKERS', '4')))
+
+# a slow or failing AI vendor should surface as a quick error instead of a hung request
+@app.errorhandler(ServiceError)
+def handle_service_error(e):
+    status = 503 if isinstance(e, (ServiceTimeout, ServiceUnavailable)) else 502
+    return jsonify({'error': str(e)}), status
 
 #-----Database------
 DATABASE = "Database/user_data.sqlite"
 
-# Use Flask's g to create a per-request connection.
+# bring the schema and indexes up to date before serving
+migrate_database(DATABASE)
+db_pool = ConnectionPool(DATABASE)
+
+# Use Flask's g to hold this request's pooled connection.
 def get_db():
     if 'db' not in g:
-        # Allow the connection to be used in multiple threads.
-        g.db = sqlite3.connect(DATABASE, check_same_thread=False)
-        g.db.row_factory = sqlite3.Row  # enables dict-like row access in templates/JSON
+        g.db = db_pool.acquire()
     return g.db
 
 @app.teardown_appcontext
 def close_connection(exception):
     db = g.pop('db', None)
     if db is not None:
-        db.close()
-        print("Database connection closed.")
+        db_pool.release(db)
 
 def insert_data(username, class_name, question1, question2, question3, question4, question5, 
                 spelling_accuracy, stutter_metric, speaking_accuracy, handwriting_metric, total_score, difficulty_level):
@@ -51,9 +90,27 @@ def insert_data(username, class_name, question1, question2, question3, question4
         ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
     """, (username, class_name, question1, question2, question3, question4, question5,
           spelling_accuracy, stutter_metric, speaking_accuracy, handwriting_metric, total_score, difficulty_level))
+    save_user(db, username, class_name)
     db.commit()
     print(f"Data inserted for user: {username}")
 
+def save_user(db, username, class_name):
+    """
+    Records the student's current class, adding them to users on their first test.
+    Their difficulty is left alone; only the dashboard changes it.
+    """
+    db.execute("""
+        INSERT INTO users (username, class) VALUES (?, ?)
+        ON CONFLICT (username) DO UPDATE SET class = excluded.class;
+    """, (username, class_name))
+
+def retrieve_user_difficulty(username):
+    """
+    :return: The student's difficulty level index, or None if they have not taken a test yet.
+    """
+    row = get_db().execute("SELECT difficulty_level FROM users WHERE username = ?;", (username,)).fetchone()
+    return row['difficulty_level'] if row else None
+
 def retrieve_data():
     db = get_db()
     cursor = db.cursor()
@@ -64,7 +121,7 @@ def retrieve_data():
 def retrieve_user_data(username):
     db = get_db()
     cursor = db.cursor()
-    cursor.execute("SELECT * FROM data WHERE username = ?;", (username,))
+    cursor.execute("SELECT * FROM data WHERE username = ? ORDER BY test_id;", (username,))
     rows = cursor.fetchall()
     return rows
 
@@ -83,14 +140,10 @@ def retrieve_learning_questions(difficulty_level):
     return rows
 
 def get_learning_data(username):
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute("SELECT * FROM data WHERE username = ?;", (username,))
-    rows = cursor.fetchall()
-    if not rows:
+    difficulty = retrieve_user_difficulty(username)
+    if difficulty is None:
         return None
     
-    difficulty = rows[0]['difficulty_level']
     questions = retrieve_learning_questions(difficulty)
     audio_files = []
     for question in questions:
@@ -127,30 +180,50 @@ def get_learning_audio_files():
 }
 '''
 
-user_dataframe = pd.DataFrame(columns=[
-    'username', 'class', 'question1', 'question2', 'question3', 'question4', 'question5',
-    'spelling_accuracy', 'stutter_metric', 'speaking_accuracy', 'handwriting_metric', 'total_score', 'difficulty_level'
-])
-
-CORRECT_ANSWER = {
-    'question1': "",
-    'question2': "", 
-    'question3': "",
-    'question4': "",
-    'question5': ""
-}
+# in-progress tests, one record per session id handed out by /start
+session_store = create_session_store()
+
+def get_session_id():
+    # clients send the id /start returned as a header, query/form field or json field;
+    # clients that do not send one yet only get a session when exactly one test is running,
+    # otherwise the request could land on another student's test
+    data = request.get_json(silent=True) or {}
+    return (request.headers.get('X-Session-Id') or request.values.get('session_id')
+            or data.get('session_id') or session_store.only_session_id())
+
+def current_session():
+    session_id = get_session_id()
+    state = session_store.get(session_id) if session_id else None
+    return session_id, state
+
+NO_SESSION_ERROR = {'error': 'No test in progress for this session, call /start first and send the session_id it returns'}
 
 
 #---END_DATABASE_____
 
 # ----- ROUTES -----
+def audio_response(text, filename, as_attachment=False):
+    """
+    Serves the mp3 of text: straight from the TTS cache when it is already rendered,
+    otherwise streamed to the client as ElevenLabs produces it (or rendered in full first
+    when TTS_STREAMING is off).
+    """
+    audio_path = cached_audio(text)
+    if audio_path is None and not TTS_STREAMING:
+        audio_path = create_audio(app, text, filename)
+    if audio_path is not None:
+        return send_file(audio_path, mimetype="audio/mpeg", as_attachment=as_attachment, download_name=filename)
+
+    disposition = 'attachment' if as_attachment else 'inline'
+    return Response(stream_audio(text), mimetype="audio/mpeg",
+                    headers={'Content-Disposition': f'{disposition}; filename="{filename}"'})
+
 @app.route('/text_to_speech', methods=['POST'])
 def text_to_speech():
     text = request.form['text']
     filename = request.args.get('filename', 'output.mp3')
     try:
-        audio_file = create_audio(app, text, filename)
-        return send_file(audio_file, as_attachment=True)
+        return audio_response(text, filename, as_attachment=True)
     except ValueError as e:
         return str(e), 500
     
@@ -160,19 +233,12 @@ def speech_to_text():
         if 'audio' not in request.files:
             return 'No file part', 400
         
-        # make dir if not exists
-        if not os.path.exists(STT_FOLDER):
-            os.makedirs(STT_FOLDER)
-
         file = request.files['audio']
         if file.filename == '':
             return 'No selected file', 400
         
-        # we need to upload file before we can pass it to whisper
-        filepath = os.path.join(STT_FOLDER, file.filename)
-        file.save(filepath)
-        
-        text = transcribe_audio(filepath)
+        with spool_upload(file) as audio:
+            text = transcribe_audio(audio, upload_filename(file))
         return text
     except ValueError as e:
         return str(e), 500
@@ -235,20 +301,30 @@ def start_test():
     classname = data['classname']
     username = data['username']
     print(f"Username: {username} Class: {classname}")
-    #fix this to reset frame values
-    user_dataframe.drop(user_dataframe.index, inplace=True)
-    user_dataframe.loc[0, user_dataframe.columns[0]] = username
-    user_dataframe.loc[0, user_dataframe.columns[1]] = classname
-    print(user_dataframe.head())
-    return jsonify({'message': f'User {username} started successfully'}), 200 
+    session_id, state = session_store.create(username, classname)
+
+    # a test always runs question one to five, so pick every prompt now and start
+    # rendering the spoken ones while the student is still on the first screen
+    state.answer1 = random.choice(QUESTION_ONE_WORDS).lower()
+    state.answer2 = random.choice(QUESTION_TWO_LETTERS).lower()
+    state.answer3 = random.choice(QUESTION_THREE_WORDS)
+    state.answer4 = random.choice(QUESTION_FOUR_WORDS)
+    state.answer5 = random.choice(QUESTION_FIVE_PHRASES)
+    session_store.save(session_id, state)
+    prefetch_audio([state.answer1, state.answer2, state.answer5])
+    return jsonify({'message': f'User {username} started successfully', 'session_id': session_id}), 200 
 
 @app.route('/question_one', methods=['GET'])
 def question_one_get():
-    word = random.choice(QUESTION_ONE_WORDS).lower()
-    CORRECT_ANSWER["question1"] = word
-    audio_path = create_audio(app, word, "word.mp3")
-    print(audio_path)
-    return send_file(audio_path, mimetype="audio/mpeg", as_attachment=False)
+    session_id, state = current_session()
+    if state is None:
+        return jsonify(NO_SESSION_ERROR), 400
+    if state.answer1 is None:
+        state = fill_prompt(session_id, 'answer1', lambda: random.choice(QUESTION_ONE_WORDS).lower())
+        if state is None:
+            return jsonify(NO_SESSION_ERROR), 400
+    word = state.answer1
+    return audio_response(word, "word.mp3")
 
 @app.route('/question_one', methods=['POST'])
 def question_one_post():
@@ -256,28 +332,34 @@ def question_one_post():
     if not data or 'question_one_answer' not in data:
         return jsonify({'error': 'Missing Question 1 Answer'}), 400
 
+    session_id, state = current_session()
+    if state is None or state.answer1 is None:
+        return jsonify(NO_SESSION_ERROR), 400
+
     question_one_answer = data['question_one_answer']
     print(question_one_answer)
 
-    if question_one_answer.lower() == CORRECT_ANSWER["question1"]:
-        user_dataframe.loc[0, user_dataframe.columns[2]] = 'correct'
-        user_dataframe.loc[0, user_dataframe.columns[7]] = 100
+    if question_one_answer.lower() == state.answer1:
+        fields = {'question1': 'correct', 'spelling_accuracy': 100}
     else:
-        relative_score = percent_correct(CORRECT_ANSWER["question1"], question_one_answer.lower())
-        user_dataframe.loc[0, user_dataframe.columns[2]] = 'incorrect'
-        user_dataframe.loc[0, user_dataframe.columns[7]] = relative_score
+        relative_score = percent_correct(state.answer1, question_one_answer.lower())
+        fields = {'question1': 'incorrect', 'spelling_accuracy': relative_score}
 
-    print(user_dataframe.head())
+    set_session_fields(session_id, fields)
     return jsonify({'message': f'Question 1 graded successfully!'}), 200
 
     
 #same as question 1 but letters instead of words 
 @app.route('/question_two', methods=['GET'])
 def question_two_get():
-    letters = "DBWM"
-    CORRECT_ANSWER["question2"] = random.choice(letters).lower()
-    audio_path = create_audio(app, CORRECT_ANSWER["question2"], "letter.mp3")
-    return send_file(audio_path, mimetype="audio/mpeg", as_attachment=False)
+    session_id, state = current_session()
+    if state is None:
+        return jsonify(NO_SESSION_ERROR), 400
+    if state.answer2 is None:
+        state = fill_prompt(session_id, 'answer2', lambda: random.choice(QUESTION_TWO_LETTERS).lower())
+        if state is None:
+            return jsonify(NO_SESSION_ERROR), 400
+    return audio_response(state.answer2, "letter.mp3")
 
 @app.route('/question_two', methods=['POST'])
 def question_two_post():
@@ -285,200 +367,322 @@ def question_two_post():
     if not data or 'question_two_answer' not in data:
         return jsonify({'error': 'Missing Question 1 Answer'}), 400
 
+    session_id, state = current_session()
+    if state is None or state.answer2 is None:
+        return jsonify(NO_SESSION_ERROR), 400
+
     question_two_answer = data['question_two_answer']
     print(question_two_answer)
 
-    if question_two_answer.lower() == CORRECT_ANSWER["question2"]:
-        user_dataframe.loc[0, user_dataframe.columns[3]] = 'correct'
+    if question_two_answer.lower() == state.answer2:
+        fields = {'question2': 'correct'}
     else:
-        user_dataframe.loc[0, user_dataframe.columns[3]] = 'incorrect'
+        fields = {'question2': 'incorrect'}
 
-    print(user_dataframe.head())
+    set_session_fields(session_id, fields)
     return jsonify({'message': f'Question 2 graded successfully!'}), 200
 
 @app.route('/question_three', methods=['GET'])
 def question_three_get():
-    word = random.choice(QUESTION_THREE_WORDS)
-    CORRECT_ANSWER["question3"] = word
+    session_id, state = current_session()
+    if state is None:
+        return jsonify(NO_SESSION_ERROR), 400
+    if state.answer3 is None:
+        state = fill_prompt(session_id, 'answer3', lambda: random.choice(QUESTION_THREE_WORDS))
+        if state is None:
+            return jsonify(NO_SESSION_ERROR), 400
+    word = state.answer3
     return jsonify({'word_prompt': word}), 200
 
+def grade_question_three(expected, audio, filename):
+    text = transcribe_audio(audio, filename)
+    print(text)
+    if expected.lower() == text.lower():
+        return {'question3': 'correct', 'speaking_accuracy': "yes"}, {}
+    return {'question3': 'incorrect', 'speaking_accuracy': "no"}, {}
+
+def grade_question_three_upload(expected, audio, filename):
+    # background jobs get the spooled copy of the upload and close it when they are done
+    with audio:
+        return grade_question_three(expected, audio, filename)
+
 @app.route('/question_three', methods=['POST'])
 def question_three_post():
-    UPLOAD_FOLDER = 'static/stt'
-    if not os.path.exists(UPLOAD_FOLDER):
-        os.makedirs(UPLOAD_FOLDER)
+    session_id, state = current_session()
+    if state is None or state.answer3 is None:
+        return jsonify(NO_SESSION_ERROR), 400
     if 'audio' not in request.files:
         return jsonify({'error': 'No audio file provided'}), 400
 
     audio_file = request.files['audio']
-    file_path = os.path.join(UPLOAD_FOLDER, "question3.m4a")
-    audio_file.save(file_path)
-    print(f"Received audio file: {file_path}")
+    print(f"Received audio file: {audio_file.filename}")
+    audio = spool_upload(audio_file)
+    if wants_async():
+        job_id = start_grading_job(session_id, 'question3', grade_question_three_upload,
+                                   state.answer3, audio, upload_filename(audio_file))
+        return accepted_response(job_id)
     
     try:
-        text = transcribe_audio(file_path)
-        print(text)
-        if CORRECT_ANSWER['question3'].lower() == text.lower():
-            user_dataframe.loc[0, user_dataframe.columns[4]] = 'correct'
-            user_dataframe.loc[0, user_dataframe.columns[9]] = "yes"
-            
-        else:
-            user_dataframe.loc[0, user_dataframe.columns[4]] = 'incorrect'
-            user_dataframe.loc[0, user_dataframe.columns[9]] = "no"
-
+        fields, _ = grade_question_three_upload(state.answer3, audio, upload_filename(audio_file))
     except Exception as e:
         return jsonify({'error': f'Transcription failed, {str(e)}'}), 500
     
-    print(user_dataframe.head())
+    set_session_fields(session_id, fields)
     
     return jsonify({'message': 'Question 3 audio received successfully'}), 200
 
 
 @app.route('/question_four', methods=['GET'])
 def question_four_get():
-    word = random.choice(QUESTION_FOUR_WORDS)
+    session_id, state = current_session()
+    if state is None:
+        return jsonify(NO_SESSION_ERROR), 400
+    if state.answer4 is None:
+        state = fill_prompt(session_id, 'answer4', lambda: random.choice(QUESTION_FOUR_WORDS))
+        if state is None:
+            return jsonify(NO_SESSION_ERROR), 400
+    word = state.answer4
     print(word)
     return jsonify({'word_prompt': word}), 200
 
+def grade_question_four(audio_bytes, mode):
+    # a retried or re-submitted clip gets the stored verdict instead of another decode + forward pass
+    key = stutter_cache.make_key(audio_bytes, mode, STUTTER_MAX_SECONDS)
+    graded = stutter_cache.get(key)
+    if graded is None:
+        graded = score_question_four(audio_bytes, mode)
+        stutter_cache.put(key, graded)
+    return graded
+
+def score_question_four(audio_bytes, mode):
+    result = {}
+    if mode == 'windowed':
+        waveform = prepare_speech(audio_bytes, max_samples=int(STUTTER_MAX_SECONDS * 16000),
+                                  max_input_samples=int(STUTTER_MAX_SECONDS * 16000), empty_if_silent=False)
+        windows = StutterCNN.extract_windows_from_array(waveform)
+        if windows is None:
+            raise ValueError('Audio file is empty')
+        window_probabilities, stutter_probability = score_stutter_windows(windows)
+        prediction = int(stutter_probability >= 0.5)
+        result['window_probabilities'] = window_probabilities
+        result['stutter_probability'] = stutter_probability
+    else:
+        # decode a bounded stretch past the first window so leading silence can be trimmed
+        # off before it, while the decode cost stays flat whatever the clip length
+        waveform = prepare_speech(audio_bytes, max_samples=StutterCNN.receptive_samples(),
+                                  max_input_samples=StutterCNN.receptive_samples() + lead_samples(),
+                                  empty_if_silent=False)
+        features = StutterCNN.extract_features_from_array(waveform)
+        if features is None:
+            raise ValueError('Audio file is empty')
+        features = features.unsqueeze(0)
+        prediction = predict_stutter_batched(features)
+    
+    print(prediction)
+    
+    if prediction==1:
+        return {'question4': 'incorrect', 'stutter_metric': 'stutter'}, result
+    return {'question4': 'correct', 'stutter_metric': 'no_stutter'}, result
+
 @app.route('/question_four', methods=['POST'])
 def question_four_post():
-    UPLOAD_FOLDER = 'static/waveforms'
-    if not os.path.exists(UPLOAD_FOLDER):
-        os.makedirs(UPLOAD_FOLDER)
+    session_id, state = current_session()
+    if state is None:
+        return jsonify(NO_SESSION_ERROR), 400
     if 'audio' not in request.files:
         return jsonify({'error': 'No audio file provided'}), 400
 
     audio_file = request.files['audio']
-    filename = audio_file.filename
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
-    audio_file.save(file_path)
-    print(f"Received audio file: {file_path}")
-    
-    model = StutterCNN()
-    model.load_state_dict(torch.load('../Models/stutter_cnn'))
+    print(f"Received audio file: {audio_file.filename}")
     
-    sound = AudioSegment.from_file(file_path, format = 'm4a')
-    file_handle = sound.export('static/waveforms/stutter_detection_audio.wav', format='wav')
-    os.remove(file_path)
-    features = model.extract_features('static/waveforms/stutter_detection_audio.wav')
-    features = features.unsqueeze(0)
-    result = model(features)
-    _, predicted = torch.max(result, 1)
-    prediction = int(predicted[0])
-    
-    print(prediction)
+    mode = request.args.get('mode', STUTTER_SCORING_MODE)
+    if wants_async():
+        job_id = start_grading_job(session_id, 'question4', grade_question_four, audio_file.read(), mode)
+        return accepted_response(job_id)
     
-    if prediction==1:
-        user_dataframe.loc[0, user_dataframe.columns[5]] = 'incorrect'
-        user_dataframe.loc[0]['stutter_metric']='stutter'
-    elif prediction==0:
-        user_dataframe.loc[0, user_dataframe.columns[5]] = 'correct'
-        user_dataframe.loc[0]['stutter_metric']='no_stutter'
+    try:
+        fields, result = grade_question_four(audio_file.read(), mode)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
         
-    print(user_dataframe.head())
+    set_session_fields(session_id, fields)
 
-    
-    return jsonify({'message': 'Question 3 audio received successfully'}), 200
+    response = {'message': 'Question 4 audio received successfully'}
+    response.update(result)
+    return jsonify(response), 200
     
     
 
 @app.route('/handwriting_analysis', methods=['POST'])
 def handwriting_analysis():
     image = request.files['image']
-    response = handwriting_test("Apple", image)
-    return jsonify(response=response)
+    is_match, confidence = grade_handwriting("Apple", image)
+    return jsonify(response=f"{is_match}, {confidence:g}%", match=is_match, confidence=confidence)
 
 @app.route('/question_five', methods=['GET'])
 def question_five_get():
-    phrase = random.choice(QUESTION_FIVE_PHRASES)
-    CORRECT_ANSWER['question5'] = phrase
-    audio_path = create_audio(app, CORRECT_ANSWER["question5"], "question5.mp3")
-    return send_file(audio_path, mimetype="audio/mpeg", as_attachment=False)
+    session_id, state = current_session()
+    if state is None:
+        return jsonify(NO_SESSION_ERROR), 400
+    if state.answer5 is None:
+        state = fill_prompt(session_id, 'answer5', lambda: random.choice(QUESTION_FIVE_PHRASES))
+        if state is None:
+            return jsonify(NO_SESSION_ERROR), 400
+    return audio_response(state.answer5, "question5.mp3")
+
+def grade_question_five(expected, image):
+    is_match, confidence = grade_handwriting(expected, image)
+    print(f"The response matches correct answer: {is_match}. Confidence on the image: {confidence}")
+    
+    return {'question5': is_match, 'handwriting_metric': confidence}, {}
 
 @app.route('/question_five', methods=['POST'])
 def question_five_post():
+    session_id, state = current_session()
+    if state is None or state.answer5 is None:
+        return jsonify(NO_SESSION_ERROR), 400
     image = request.files['image']
-    response = handwriting_test(CORRECT_ANSWER['question5'], image)
-    print(f"Response: {response}")
-    is_match, confidence = response.split(',')
-    is_match = is_match.strip().lower()
-    # trimming out any space or percent
-    confidence = confidence.strip().strip('%').strip(".")
-    try:
-        confidence = float(confidence)
-    except ValueError:
-        match = re.search(r'\d{1,2}', confidence)
-        confidence = float(match.group()) if match else 0
-    print(f"The response matches correct answer: {is_match}. Confidence on the image: {confidence}")
-    
-    user_dataframe.loc[0, user_dataframe.columns[6]] = is_match
-    user_dataframe.loc[0, user_dataframe.columns[10]] = confidence
-    
-    print(user_dataframe.head())
+    if wants_async():
+        # keep the bytes, the request's upload stream is gone once we return
+        image = FileStorage(io.BytesIO(image.read()), filename=image.filename, content_type=image.content_type)
+        job_id = start_grading_job(session_id, 'question5', grade_question_five, state.answer5, image)
+        return accepted_response(job_id)
+
+    fields, _ = grade_question_five(state.answer5, image)
+    set_session_fields(session_id, fields)
     
     return jsonify({'message': 'Handwriting image received successfully'}), 200
 
 
+#----- Background grading -----
+def wants_async():
+    # opt in per request with ?async=1, or for every request with GRADING_ASYNC=1
+    return request.args.get('async', '1' if GRADING_ASYNC else '0') == '1'
+
+def set_session_fields(session_id, fields):
+    # a read-modify-write through update(), never save(), so results a grading job stored
+    # after this request loaded the session are not reverted
+    def apply(state):
+        for name, value in fields.items():
+            setattr(state, name, value)
+    session_store.update(session_id, apply)
+
+def fill_prompt(session_id, field, choose):
+    """
+    Picks a prompt for a session that has none yet, keeping one a concurrent request picked first.
+
+    :return: The updated state, or None if the session is gone.
+    """
+    def apply(state):
+        if getattr(state, field) is None:
+            setattr(state, field, choose())
+    return session_store.update(session_id, apply)
+
+def start_grading_job(session_id, question, grade, *args):
+    """
+    Records a pending job on the session and runs grade(*args) on the grading pool.
+    The job writes its fields and final status back through the session store, so any
+    worker sharing the store can report on it and finish_test can wait for it.
+    """
+    job_id = secrets.token_urlsafe(12)
+    job = {'question': question, 'status': 'pending', 'error': None, 'result': None}
+    session_store.update(session_id, lambda state: state.jobs.__setitem__(job_id, job))
+
+    def run():
+        try:
+            fields, result = grade(*args)
+            finished = dict(job, status='done', result=result)
+        except Exception as e:
+            print(f"Grading job {job_id} for {question} failed: {e}")
+            fields, finished = {}, dict(job, status='failed', error=str(e))
+
+        def apply(state):
+            for name, value in fields.items():
+                setattr(state, name, value)
+            state.jobs[job_id] = finished
+        session_store.update(session_id, apply)
+
+    grading_executor.submit(run)
+    return job_id
+
+def accepted_response(job_id):
+    return jsonify({'message': 'Grading started', 'job_id': job_id,
+                    'status_url': url_for('grading_job_status', job_id=job_id)}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def grading_job_status(job_id):
+    _, state = current_session()
+    if state is None or job_id not in state.jobs:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(dict(state.jobs[job_id], job_id=job_id)), 200
+
+def wait_for_grading_jobs(session_id, timeout):
+    # polls the store rather than local futures so it also sees jobs running on other workers
+    deadline = time.monotonic() + timeout
+    state = session_store.get(session_id)
+    while state is not None and state.pending_jobs() and time.monotonic() < deadline:
+        time.sleep(0.05)
+        state = session_store.get(session_id)
+    return state
+
+
 @app.route('/finish_test', methods=['POST'])
 def finish_test():
-    db = get_db()
-    cursor = db.cursor()
-
-    if user_dataframe.empty:
+    session_id, state = current_session()
+    if state is None:
         return jsonify({'error': 'No test data to save'}), 400
+    if state.pending_jobs():
+        state = wait_for_grading_jobs(session_id, GRADING_WAIT_SECONDS)
+        if state is None:
+            return jsonify({'error': 'No test data to save'}), 400
+        if state.pending_jobs():
+            return jsonify({'error': 'Grading is still in progress, try again shortly'}), 503
     
     total_score=100
     stutter_deduction=0
     speaking_deduction=0
     question2_deduction=0
+    # unanswered spelling counts as 0% accurate
+    spelling_accuracy = state.spelling_accuracy if state.spelling_accuracy is not None else 0
     
-    spelling_deduction= ((100.0 - user_dataframe.loc[0]['spelling_accuracy']) / 100) * -20
-    if user_dataframe.loc[0]['stutter_metric'] =='no_stutter':
+    spelling_deduction= ((100.0 - spelling_accuracy) / 100) * -20
+    if state.stutter_metric =='no_stutter':
         stutter_deduction=0
     else:
         stutter_deduction=-20
 
-    if user_dataframe.loc[0]['speaking_accuracy'] =='correct':
+    if state.speaking_accuracy =='correct':
         speaking_deduction=0
     else:
         speaking_deduction=-20 
         
-    if user_dataframe.loc[0]['question2']=='correct':
+    if state.question2=='correct':
         question2_deduction=0
-    elif user_dataframe.loc[0]['question2']=='incorrect':
+    elif state.question2=='incorrect':
         question2_deduction=-20
     
-    handwriting_deduction= ((100.0 - user_dataframe.loc[0]['spelling_accuracy']) / 100) * -20
+    handwriting_deduction= ((100.0 - spelling_accuracy) / 100) * -20
     
     total_score = total_score + spelling_deduction + stutter_deduction + speaking_deduction + handwriting_deduction + question2_deduction
     
-    user_dataframe.loc[0]['total_score']=total_score
-    test_data = user_dataframe.loc[0].to_dict()
+    state.total_score = total_score
+    # only check a pooled connection out once grading has finished, not while waiting for it
+    db = get_db()
+    # keep a record of the difficulty this test was taken at
+    difficulty = retrieve_user_difficulty(state.username)
+    state.difficulty_level = difficulty if difficulty is not None else 0
 
     db.execute("""
         INSERT INTO data (
             username, class, question1, question2, question3, question4, question5, 
             spelling_accuracy, stutter_metric, speaking_accuracy, handwriting_metric, total_score, difficulty_level
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
-    """, (
-        test_data.get('username', 'Unknown'),
-        test_data.get('class', 'N/A'),
-        test_data.get('question1', 'N/A'),
-        test_data.get('question2', 'N/A'),
-        test_data.get('question3', 'N/A'),
-        test_data.get('question4', 'N/A'),
-        test_data.get('question5', 'N/A'),
-        test_data.get('spelling_accuracy', 0),
-        test_data.get('stutter_metric', 'N/A'),
-        test_data.get('speaking_accuracy', 'N/A'),
-        test_data.get('handwriting_metric', 0),
-        test_data.get('total_score', 0),
-        test_data.get('difficulty_level', 0)
-    ))
-    
+    """, state.result_row())
+    save_user(db, state.username, state.class_name)
     
     db.commit() 
-    print(f"Test data saved for user: {test_data.get('username', 'Unknown')}")
+    session_store.pop(session_id)
+    print(f"Test data saved for user: {state.username}")
  
     return jsonify({'message': 'Test results saved successfully'}), 200
 
@@ -0,0 +1,133 @@
+from pydub import AudioSegment
+from dotenv import load_dotenv
+import os
+import subprocess
+import numpy as np
+
+load_dotenv()
+
+TARGET_SAMPLE_RATE = 16000
+
+# energy-based voice activity trimming of leading/trailing silence
+AUDIO_VAD_TRIM = os.getenv('AUDIO_VAD_TRIM', '1') == '1'
+# frames quieter than the loudest frame by more than this are treated as silence
+AUDIO_VAD_THRESHOLD_DB = float(os.getenv('AUDIO_VAD_THRESHOLD_DB', '35'))
+# ...and so is anything below this absolute level, so a silent clip is not "all speech"
+AUDIO_VAD_FLOOR_DB = float(os.getenv('AUDIO_VAD_FLOOR_DB', '-55'))
+# speech kept on either side of the detected region so soft onsets are not clipped
+AUDIO_VAD_PAD_MS = float(os.getenv('AUDIO_VAD_PAD_MS', '150'))
+AUDIO_VAD_FRAME_MS = 20
+# leading silence decoded past a model's input length so it can still be trimmed off
+AUDIO_VAD_MAX_LEAD_MS = float(os.getenv('AUDIO_VAD_MAX_LEAD_MS', '3000'))
+
+
+def decode_audio(data, sample_rate=TARGET_SAMPLE_RATE, max_samples=None):
+    """
+    Decodes an uploaded recording straight into a mono float32 waveform without
+    touching the disk. ffmpeg reads the bytes from stdin (through its cache
+    protocol, so m4a files with a trailing moov atom still work) and writes raw
+    float32 PCM to stdout, which keeps every request isolated from the others.
+
+    :param data: Raw bytes of the uploaded file (m4a, wav, mp3, ...).
+    :param sample_rate: Output sample rate in Hz.
+    :param max_samples: If set, ffmpeg stops decoding once this many samples are produced.
+    :return: 1-D numpy float32 array in [-1, 1].
+    """
+    command = [
+        AudioSegment.converter,  # the ffmpeg binary pydub is configured with
+        '-nostdin', '-hide_banner', '-loglevel', 'error',
+        '-i', 'cache:pipe:0',
+        '-vn',
+        '-ac', '1',
+        '-ar', str(sample_rate),
+        '-f', 'f32le',
+    ]
+    if max_samples is not None:
+        # small margin so rounding in ffmpeg's duration handling never leaves us short
+        duration = (max_samples + sample_rate // 100) / sample_rate
+        command += ['-t', f'{duration:.6f}']
+    command.append('pipe:1')
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate(input=data)
+    if process.returncode != 0:
+        raise ValueError(f"Audio decoding failed: {err.decode(errors='ignore').strip()}")
+
+    y = np.frombuffer(out, dtype=np.float32)
+    if max_samples is not None:
+        y = y[:max_samples]
+    return y
+
+
+def trim_silence(y, sample_rate=TARGET_SAMPLE_RATE, threshold_db=AUDIO_VAD_THRESHOLD_DB,
+                 floor_db=AUDIO_VAD_FLOOR_DB, pad_ms=AUDIO_VAD_PAD_MS):
+    """
+    Cuts leading and trailing silence from a waveform. Frames whose RMS level is within
+    threshold_db of the loudest frame (and above floor_db dBFS) count as speech; the
+    result runs from the first to the last speech frame plus pad_ms either side.
+
+    :return: The trimmed waveform (a view of y), or an empty array if no frame is speech.
+    """
+    frame = int(sample_rate * AUDIO_VAD_FRAME_MS / 1000)
+    n_frames = len(y) // frame
+    if n_frames == 0:
+        return y
+    frames = y[:n_frames * frame].reshape(n_frames, frame)
+    rms_db = 10 * np.log10(np.mean(frames.astype(np.float64) ** 2, axis=1) + 1e-12)
+    threshold = max(rms_db.max() - threshold_db, floor_db)
+    speech = np.flatnonzero(rms_db >= threshold)
+    if len(speech) == 0:
+        return y[:0]
+
+    pad = int(sample_rate * pad_ms / 1000)
+    start = max(speech[0] * frame - pad, 0)
+    end = min((speech[-1] + 1) * frame + pad, len(y))
+    return y[start:end]
+
+
+def prepare_speech(data, sample_rate=TARGET_SAMPLE_RATE, max_samples=None, max_input_samples=None,
+                   trim=AUDIO_VAD_TRIM, empty_if_silent=True):
+    """
+    Shared preprocessing for speech models: decode to mono at sample_rate, then trim the
+    silence around the speech so models and uploads only see the part that matters.
+
+    :param max_samples: Longest waveform returned, counted after trimming.
+    :param max_input_samples: Stop decoding after this many samples of the recording.
+    :param empty_if_silent: If False, a recording with nothing above the silence threshold
+                            is returned untrimmed instead of as an empty array.
+    """
+    y = decode_audio(data, sample_rate=sample_rate, max_samples=max_input_samples)
+    if trim:
+        trimmed = trim_silence(y, sample_rate)
+        if len(trimmed) or empty_if_silent:
+            y = trimmed
+    if max_samples is not None:
+        y = y[:max_samples]
+    return y
+
+
+def lead_samples(sample_rate=TARGET_SAMPLE_RATE):
+    """
+    Samples of leading silence AUDIO_VAD_MAX_LEAD_MS allows for, to add to a decode cap.
+    """
+    return int(AUDIO_VAD_MAX_LEAD_MS / 1000 * sample_rate) if AUDIO_VAD_TRIM else 0
+
+
+def encode_audio(y, sample_rate=TARGET_SAMPLE_RATE, bitrate='24k'):
+    """
+    Re-encodes a mono float32 waveform as Opus in an Ogg container, entirely through pipes.
+    At 16 kHz speech this is a fraction of the size of the phone's AAC upload.
+
+    :return: The encoded file as bytes.
+    """
+    command = [
+        AudioSegment.converter,
+        '-nostdin', '-hide_banner', '-loglevel', 'error',
+        '-f', 'f32le', '-ar', str(sample_rate), '-ac', '1', '-i', 'pipe:0',
+        '-c:a', 'libopus', '-b:a', bitrate, '-application', 'voip',
+        '-f', 'ogg', 'pipe:1',
+    ]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate(input=np.ascontiguousarray(y, dtype=np.float32).tobytes())
+    if process.returncode != 0:
+        raise ValueError(f"Audio encoding failed: {err.decode(errors='ignore').strip()}")
+    return out
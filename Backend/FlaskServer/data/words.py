@@ -19,6 +19,8 @@ QUESTION_ONE_WORDS = [
     'Koala'
 ]
 
+QUESTION_TWO_LETTERS = "DBWM"
+
 QUESTION_THREE_WORDS = ["orange", 
                         "banana", 
                         "triangle",
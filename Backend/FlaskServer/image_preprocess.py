@@ -0,0 +1,101 @@
+from PIL import Image, ImageFilter, ImageOps
+from dotenv import load_dotenv
+import io
+import os
+
+load_dotenv()
+
+# longest side of the image sent to the vision model, after cropping to the writing
+HANDWRITING_MAX_SIDE = int(os.getenv('HANDWRITING_MAX_SIDE', '1024'))
+# "JPEG" or "PNG"
+HANDWRITING_IMAGE_FORMAT = os.getenv('HANDWRITING_IMAGE_FORMAT', 'JPEG').upper()
+HANDWRITING_JPEG_QUALITY = int(os.getenv('HANDWRITING_JPEG_QUALITY', '85'))
+# a pixel counts as ink when it is this much darker than the page around it (0-255)
+HANDWRITING_INK_CONTRAST = int(os.getenv('HANDWRITING_INK_CONTRAST', '60'))
+# blank space kept around the writing, as a fraction of the ink box
+HANDWRITING_CROP_MARGIN = float(os.getenv('HANDWRITING_CROP_MARGIN', '0.08'))
+
+MIME_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'GIF': 'image/gif', 'WEBP': 'image/webp'}
+
+# the ink box is found on a copy this small, which is plenty to locate a written phrase
+_MASK_SIDE = 512
+
+
+def ink_bbox(gray):
+    """
+    Bounding box of the writing in a grayscale photo of paper or a whiteboard, as
+    (left, upper, right, lower) in gray's coordinates, or None if no ink is found.
+
+    Ink is anything clearly darker than the page (its median brightness); a median
+    filter drops specks and sensor noise so they do not stretch the box.
+    """
+    small = gray.copy()
+    small.thumbnail((_MASK_SIDE, _MASK_SIDE))
+    small = small.filter(ImageFilter.MedianFilter(5))
+    page = sorted(small.getdata())[small.width * small.height // 2]
+    threshold = page - HANDWRITING_INK_CONTRAST
+    bbox = small.point(lambda p: 255 if p < threshold else 0).getbbox()
+    if bbox is None:
+        return None
+
+    scale_x, scale_y = gray.width / small.width, gray.height / small.height
+    left, upper, right, lower = bbox
+    margin_x = (right - left) * HANDWRITING_CROP_MARGIN + 2
+    margin_y = (lower - upper) * HANDWRITING_CROP_MARGIN + 2
+    return (max(int((left - margin_x) * scale_x), 0),
+            max(int((upper - margin_y) * scale_y), 0),
+            min(int((right + margin_x) * scale_x), gray.width),
+            min(int((lower + margin_y) * scale_y), gray.height))
+
+
+def crop_handwriting(data, max_side=HANDWRITING_MAX_SIDE):
+    """
+    Decodes an uploaded photo of handwriting in memory, applies its EXIF rotation,
+    converts it to grayscale, crops it to the writing and shrinks it to max_side.
+
+    :param data: Raw bytes of the uploaded image.
+    :return: A grayscale ("L" mode) PIL image.
+    :raises ValueError: If the bytes are not an image Pillow can read.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        image = ImageOps.exif_transpose(image)
+        gray = image.convert('L')
+    except Exception as e:
+        raise ValueError(f"Could not read image: {e}")
+
+    bbox = ink_bbox(gray)
+    if bbox is not None:
+        gray = gray.crop(bbox)
+    gray.thumbnail((max_side, max_side), Image.LANCZOS)
+    return gray
+
+
+def preprocess_handwriting(data, max_side=HANDWRITING_MAX_SIDE, image_format=HANDWRITING_IMAGE_FORMAT):
+    """
+    Turns a phone photo of handwriting into a small image for the vision model without
+    touching the disk: crop_handwriting, then re-encode.
+
+    :param data: Raw bytes of the uploaded image.
+    :return: (encoded bytes, MIME type).
+    :raises ValueError: If the bytes are not an image Pillow can read.
+    """
+    gray = crop_handwriting(data, max_side)
+
+    out = io.BytesIO()
+    if image_format == 'PNG':
+        gray.save(out, format='PNG', optimize=True)
+    else:
+        image_format = 'JPEG'
+        gray.save(out, format='JPEG', quality=HANDWRITING_JPEG_QUALITY, optimize=True)
+    return out.getvalue(), MIME_TYPES[image_format]
+
+
+def sniff_mime_type(data, default='image/jpeg'):
+    """
+    MIME type of an image from its bytes, for uploads that are sent on unprocessed.
+    """
+    try:
+        return MIME_TYPES.get(Image.open(io.BytesIO(data)).format, default)
+    except Exception:
+        return default
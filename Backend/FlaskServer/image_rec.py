@@ -2,29 +2,52 @@ from openai import OpenAI
 from dotenv import load_dotenv
 import os
 import base64
+from vendor_calls import vision_service
+from image_preprocess import crop_handwriting, preprocess_handwriting, sniff_mime_type
+from models.handwriting import HandwritingCNN, HANDWRITING_MODEL_PATH
+from abc import ABC, abstractmethod
+import re
+import threading
+import torch
 
 load_dotenv()
 
 client = OpenAI(
-    api_key = os.getenv('OPENAI_IMAGE_API_KEY')
+    api_key = os.getenv('OPENAI_IMAGE_API_KEY'),
+    timeout = vision_service.timeout,
+    # retries are vision_service's job; SDK retries would outlive its deadline
+    max_retries = 0,
 )
 
+# "openai" grades with GPT-4o, "local" with the HandwritingCNN trained by train_handwriting_model.py
+HANDWRITING_BACKEND = os.getenv('HANDWRITING_BACKEND', 'openai')
+# the local model only calls a photo a match when it is at least this sure of the expected phrase
+HANDWRITING_MATCH_THRESHOLD = float(os.getenv('HANDWRITING_MATCH_THRESHOLD', '0.5'))
+
+# 0 sends the photo exactly as uploaded instead of the cropped grayscale version
+HANDWRITING_PREPROCESS = os.getenv('HANDWRITING_PREPROCESS', '1') == '1'
+
 # Function to encode the image
-def encode_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
-
-def handwriting_test(correct_answer, image):
-    folder = "/static/handwritten/"
-    if not os.path.exists(folder):
-        os.makedirs(folder)
-    image_path = folder + "handwriting.png"
-    
-    image.save(image_path)
-    
-    encoded_image = encode_image(image_path)
+def encode_image(data, mime_type):
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('utf-8')}"
+
+def prepare_image(data):
+    """
+    :return: (image bytes, MIME type) to send to the vision model.
+    """
+    if HANDWRITING_PREPROCESS:
+        try:
+            return preprocess_handwriting(data)
+        except ValueError as e:
+            # e.g. a format Pillow cannot decode, the vision model may still manage
+            print(f"Could not preprocess handwriting image, sending it as is: {e}")
+    return data, sniff_mime_type(data)
+
+def _ask_vision_model(correct_answer, data):
+    data, mime_type = prepare_image(data)
+    encoded_image = encode_image(data, mime_type)
     
-    response = client.chat.completions.create(
+    response = vision_service.call(_create_completion,
         model = "gpt-4o",
         messages = [
             {
@@ -40,7 +63,7 @@ def handwriting_test(correct_answer, image):
                     },
                     {
                         "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}
+                        "image_url": {"url": encoded_image}
                     }
                 ]
             }
@@ -50,3 +73,111 @@ def handwriting_test(correct_answer, image):
     content = response.choices[0].message.content
     print(content)
     return content
+
+def _create_completion(**kwargs):
+    # runs on a vision_service worker, which knows how much of the deadline is left
+    return client.chat.completions.create(timeout=vision_service.remaining(), **kwargs)
+
+def parse_grading(response):
+    """
+    Reads the (match, confidence) pair out of GPT-4o's "yes/no, NN%" answer.
+    """
+    is_match, confidence = response.split(',')
+    is_match = is_match.strip().lower()
+    # trimming out any space or percent
+    confidence = confidence.strip().strip('%').strip(".")
+    try:
+        confidence = float(confidence)
+    except ValueError:
+        match = re.search(r'\d{1,2}', confidence)
+        confidence = float(match.group()) if match else 0
+    return is_match, confidence
+
+
+class HandwritingGrader(ABC):
+    """
+    Interface for handwriting grading backends.
+    """
+
+    @abstractmethod
+    def grade(self, correct_answer, data):
+        """
+        :param correct_answer: The phrase the student was asked to write.
+        :param data: Raw bytes of the uploaded photo.
+        :return: (match, confidence): "yes" or "no", and a 0-100 similarity score.
+        """
+
+
+class OpenAIHandwritingGrader(HandwritingGrader):
+
+    def grade(self, correct_answer, data):
+        response = _ask_vision_model(correct_answer, data)
+        print(f"Response: {response}")
+        return parse_grading(response)
+
+
+class LocalHandwritingGrader(HandwritingGrader):
+    """
+    HandwritingCNN on the CPU. The checkpoint holds the phrase list it was trained on;
+    phrases it has not seen (e.g. one just added to QUESTION_FIVE_PHRASES) are handed to
+    GPT-4o until the model is retrained.
+    """
+
+    def __init__(self, path=HANDWRITING_MODEL_PATH):
+        checkpoint = torch.load(path, map_location='cpu', weights_only=True)
+        self.classes = list(checkpoint['classes'])
+        self.model = HandwritingCNN(len(self.classes))
+        self.model.load_state_dict(checkpoint['state_dict'])
+        self.model.eval()
+        with torch.inference_mode():
+            self.model(torch.zeros(1, 1, HandwritingCNN.INPUT_HEIGHT, HandwritingCNN.INPUT_WIDTH))
+        print(f"Handwriting model loaded from {path}")
+
+    def grade(self, correct_answer, data):
+        if correct_answer not in self.classes:
+            print(f"The handwriting model was not trained on '{correct_answer}', asking GPT-4o instead")
+            return OpenAIHandwritingGrader().grade(correct_answer, data)
+        features = HandwritingCNN.image_to_tensor(crop_handwriting(data)).unsqueeze(0)
+        with torch.inference_mode():
+            probabilities = torch.softmax(self.model(features), dim=1)[0]
+        expected = self.classes.index(correct_answer)
+        probability = float(probabilities[expected])
+        is_match = int(probabilities.argmax()) == expected and probability >= HANDWRITING_MATCH_THRESHOLD
+        return ("yes" if is_match else "no"), round(probability * 100, 1)
+
+
+_grader = None
+_grader_lock = threading.Lock()
+
+
+def create_handwriting_grader(backend=HANDWRITING_BACKEND):
+    """
+    Builds the handwriting backend selected by HANDWRITING_BACKEND.
+    """
+    if backend == 'local':
+        return LocalHandwritingGrader()
+    if backend == 'openai':
+        return OpenAIHandwritingGrader()
+    raise ValueError(f"Unknown handwriting backend: {backend}")
+
+
+def get_handwriting_grader():
+    """
+    Returns the process-wide handwriting grader, loading it on first use.
+    """
+    global _grader
+    if _grader is None:
+        with _grader_lock:
+            if _grader is None:
+                _grader = create_handwriting_grader()
+    return _grader
+
+
+def grade_handwriting(correct_answer, image):
+    """
+    Grades a photo of handwriting with the configured backend.
+
+    :param image: The uploaded image (a werkzeug FileStorage).
+    :return: (match, confidence): "yes" or "no", and a 0-100 similarity score.
+    """
+    return get_handwriting_grader().grade(correct_answer, image.read())
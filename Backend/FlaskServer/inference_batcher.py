@@ -0,0 +1,78 @@
+from concurrent.futures import Future
+import queue
+import threading
+import time
+import torch
+
+
+class MicroBatcher:
+    """
+    Collects feature tensors submitted from concurrent request threads and runs
+    them through the model as one batched forward pass.
+
+    A batch is dispatched once it holds max_batch_size items or once the oldest
+    waiting item has been queued for max_wait_ms, whichever comes first.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5, collate_fn=None):
+        """
+        :param predict_fn: Callable taking a (batch, ...) tensor and returning one prediction per row.
+        :param max_batch_size: Largest number of requests merged into one forward pass.
+        :param max_wait_ms: Longest time the first request of a batch waits for company.
+        :param collate_fn: Callable merging the submitted samples into predict_fn's input.
+                           Defaults to concatenating them along the batch dimension.
+        """
+        self.predict_fn = predict_fn
+        self.collate_fn = collate_fn or (lambda inputs: torch.cat(inputs, dim=0))
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, features):
+        """
+        Queues a single sample and returns a Future resolving to its prediction.
+
+        :param features: Tensor for one sample, with a leading batch dimension of 1.
+        """
+        future = Future()
+        self._queue.put((features, future))
+        return future
+
+    def predict(self, features, timeout=None):
+        """
+        Blocking helper around submit().
+        """
+        return self.submit(features).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # drop callers that cancelled while waiting in the queue
+            batch = [(features, future) for features, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            inputs = [features for features, _ in batch]
+            futures = [future for _, future in batch]
+            try:
+                predictions = self.predict_fn(self.collate_fn(inputs))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, prediction in zip(futures, predictions):
+                future.set_result(prediction)
@@ -3,7 +3,7 @@ from text_to_speech import create_audio
 from speech_to_text import transcribe_audio
 from data.words import QUESTION_ONE_WORDS, QUESTION_THREE_WORDS, QUESTION_FOUR_WORDS, QUESTION_FIVE_PHRASES
 from models.modelV1 import StutterCNN
-from image_rec import handwriting_test
+from image_rec import grade_handwriting
 from dotenv import load_dotenv
 import os
 import random
@@ -11,7 +11,6 @@ import pandas as pd
 import sqlite3
 import torch
 from pydub import AudioSegment
-import re
 
 # loading env vars
 load_dotenv()
@@ -415,8 +414,8 @@ def question_four_post():
 @app.route('/handwriting_analysis', methods=['POST'])
 def handwriting_analysis():
     image = request.files['image']
-    response = handwriting_test("Apple", image)
-    return jsonify(response=response)
+    is_match, confidence = grade_handwriting("Apple", image)
+    return jsonify(response=f"{is_match}, {confidence:g}%", match=is_match, confidence=confidence)
 
 @app.route('/question_five', methods=['GET'])
 def question_five_get():
@@ -428,17 +427,7 @@ def question_five_get():
 @app.route('/question_five', methods=['POST'])
 def question_five_post():
     image = request.files['image']
-    response = handwriting_test(CORRECT_ANSWER['question5'], image)
-    print(f"Response: {response}")
-    is_match, confidence = response.split(',')
-    is_match = is_match.strip().lower()
-    # trimming out any space or percent
-    confidence = confidence.strip().strip('%').strip(".")
-    try:
-        confidence = float(confidence)
-    except ValueError:
-        match = re.search(r'\d{1,2}', confidence)
-        confidence = float(match.group()) if match else 0
+    is_match, confidence = grade_handwriting(CORRECT_ANSWER['question5'], image)
     print(f"The response matches correct answer: {is_match}. Confidence on the image: {confidence}")
     
     user_dataframe.loc[0, user_dataframe.columns[6]] = is_match
@@ -0,0 +1,140 @@
+from models.modelV1 import StutterCNN
+from inference_batcher import MicroBatcher
+from dotenv import load_dotenv
+import os
+import threading
+import torch
+
+load_dotenv()
+
+STUTTER_MODEL_PATH = os.getenv('STUTTER_MODEL_PATH', '../Models/stutter_cnn')
+# int8 TorchScript build produced by quantize_model.py
+STUTTER_MODEL_QUANTIZED = os.getenv('STUTTER_MODEL_QUANTIZED', '0') == '1'
+STUTTER_QUANTIZED_MODEL_PATH = os.getenv('STUTTER_QUANTIZED_MODEL_PATH', '../Models/stutter_cnn_int8.pt')
+# memory-map the fp32 checkpoint read-only so every worker process shares one copy of
+# the weights through the page cache instead of deserializing its own
+STUTTER_MODEL_MMAP = os.getenv('STUTTER_MODEL_MMAP', '1') == '1'
+# 0 leaves torch's default (one thread per core)
+STUTTER_NUM_THREADS = int(os.getenv('STUTTER_NUM_THREADS', '0'))
+STUTTER_MAX_BATCH_SIZE = int(os.getenv('STUTTER_MAX_BATCH_SIZE', '16'))
+STUTTER_MAX_WAIT_MS = float(os.getenv('STUTTER_MAX_WAIT_MS', '5'))
+
+# (channels, mel bands + zcr + flatness + rms, frames) expected by StutterCNN.fc1
+STUTTER_INPUT_SHAPE = (1, 131, 100)
+
+_stutter_model = None
+_stutter_batcher = None
+_stutter_lock = threading.Lock()
+
+
+def load_state_dict_model(path, mmap=True):
+    """
+    Loads the fp32 StutterCNN checkpoint. With mmap the tensors in the returned model are
+    views onto the checkpoint file (copy-on-write, never written to), so N workers cost one
+    physical copy of fc1 and startup skips reading the whole file into fresh buffers.
+
+    The checkpoint has to be in torch's default zip format (what torch.save writes),
+    which is how stutter_detection_training.ipynb saves it.
+    """
+    if not mmap:
+        model = StutterCNN()
+        model.load_state_dict(torch.load(path, map_location='cpu'))
+        return model
+
+    # build on the meta device so no throwaway random weights are allocated,
+    # then assign the mapped tensors instead of copying them into parameters
+    with torch.device('meta'):
+        model = StutterCNN()
+    state_dict = torch.load(path, map_location='cpu', mmap=True, weights_only=True)
+    model.load_state_dict(state_dict, assign=True)
+    return model
+
+
+def load_stutter_model(path=None, quantized=STUTTER_MODEL_QUANTIZED):
+    """
+    Builds a StutterCNN from a checkpoint, switches it to eval mode and runs one
+    dummy forward pass so the first real request does not pay for allocator warm-up.
+
+    :param path: Path to the saved state dict, or to the TorchScript file when quantized.
+    :param quantized: Load the int8 TorchScript build instead of the fp32 checkpoint.
+    :return: The ready-to-serve model.
+    """
+    if STUTTER_NUM_THREADS > 0:
+        torch.set_num_threads(STUTTER_NUM_THREADS)
+
+    if quantized:
+        path = path or STUTTER_QUANTIZED_MODEL_PATH
+        model = torch.jit.load(path, map_location='cpu')
+    else:
+        path = path or STUTTER_MODEL_PATH
+        model = load_state_dict_model(path, mmap=STUTTER_MODEL_MMAP)
+    model.eval()
+    with torch.inference_mode():
+        model(torch.zeros((1,) + STUTTER_INPUT_SHAPE))
+    print(f"Stutter model loaded from {path}")
+    return model
+
+
+def get_stutter_model():
+    """
+    Returns the process-wide StutterCNN, loading it on first use.
+    """
+    global _stutter_model
+    if _stutter_model is None:
+        with _stutter_lock:
+            if _stutter_model is None:
+                _stutter_model = load_stutter_model()
+    return _stutter_model
+
+
+def get_stutter_batcher():
+    """
+    Returns the process-wide micro-batcher sitting in front of the stutter model.
+    """
+    global _stutter_batcher
+    if _stutter_batcher is None:
+        with _stutter_lock:
+            if _stutter_batcher is None:
+                _stutter_batcher = MicroBatcher(predict_stutter,
+                                                max_batch_size=STUTTER_MAX_BATCH_SIZE,
+                                                max_wait_ms=STUTTER_MAX_WAIT_MS)
+    return _stutter_batcher
+
+
+def predict_stutter_batched(features):
+    """
+    Predicts a single sample, sharing a forward pass with any concurrent requests.
+
+    :param features: Tensor shaped (1, 1, 131, 100).
+    :return: The predicted class index, 1 meaning stutter.
+    """
+    get_stutter_model()
+    return get_stutter_batcher().predict(features)
+
+
+def predict_stutter(features):
+    """
+    Runs the stutter model on a batch of features.
+
+    :param features: Tensor shaped (batch, 1, 131, 100).
+    :return: List of predicted class indices, 1 meaning stutter.
+    """
+    model = get_stutter_model()
+    with torch.inference_mode():
+        result = model(features)
+    _, predicted = torch.max(result, 1)
+    return predicted.tolist()
+
+
+def score_stutter_windows(windows):
+    """
+    Scores every window of a recording in one batched forward pass.
+
+    :param windows: Tensor shaped (n_windows, 1, 131, 100).
+    :return: (per-window stutter probabilities, aggregate probability). The aggregate is the
+             highest window probability, since a single disfluent window is enough to flag a stutter.
+    """
+    model = get_stutter_model()
+    with torch.inference_mode():
+        probabilities = torch.softmax(model(windows), dim=1)[:, 1].tolist()
+    return probabilities, max(probabilities)
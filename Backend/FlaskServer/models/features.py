@@ -0,0 +1,230 @@
+import functools
+import sys
+import numpy as np
+import librosa
+
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+AMIN = 1e-10
+TOP_DB = 80.0
+ZCR_THRESHOLD = 1e-10
+
+
+@functools.lru_cache(maxsize=None)
+def _mel_basis(sr, n_fft, n_mels):
+    return librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels)
+
+
+@functools.lru_cache(maxsize=None)
+def _window(n_fft):
+    return librosa.filters.get_window('hann', n_fft, fftbins=True).astype(np.float32)
+
+
+def _zero_crossing_rate(y, n_fft, hop_length, n_frames):
+    # librosa edge-pads the signal for zcr, so its frames differ from the stft frames
+    # at the borders. Counting crossings once per sample and windowing the running
+    # sum gives the same per-frame counts in O(n) instead of O(n * n_fft).
+    y = np.pad(y, n_fft // 2, mode='edge')
+    y = np.where(np.abs(y) <= ZCR_THRESHOLD, 0, y)
+    sign = np.signbit(y)
+    crossings = np.concatenate(([0], np.cumsum(sign[1:] != sign[:-1])))
+    starts = np.arange(n_frames) * hop_length
+    return (crossings[starts + n_fft - 1] - crossings[starts]) / n_fft
+
+
+def window_samples(n_frames, n_fft=N_FFT, hop_length=HOP_LENGTH):
+    """
+    Number of leading samples that fully determine the first n_frames centered frames.
+    Anything after this point cannot change those frames.
+    """
+    return (n_frames - 1) * hop_length + n_fft // 2
+
+
+def extract_stutter_features(y, sr=16000, n_fft=N_FFT, hop_length=HOP_LENGTH, n_mels=N_MELS, max_frames=None):
+    """
+    Computes the StutterCNN feature rows (mel spectrogram in dB, zero crossing rate,
+    spectral flatness and rms) from a single framing of the signal and one STFT.
+
+    Matches np.vstack of librosa.power_to_db(melspectrogram(y, sr), ref=np.max),
+    zero_crossing_rate(y), spectral_flatness(y) and rms(y) with librosa's defaults.
+
+    :param y: Mono waveform as a 1-D float32 array.
+    :param sr: Sample rate of y.
+    :param max_frames: If set, only the first max_frames frames are computed and samples
+                       past window_samples(max_frames) are ignored. The dB reference is then
+                       the loudest frame inside that window.
+    :return: Array shaped (n_mels + 3, n_frames).
+    """
+    mel_spec, zcr, spectral_flatness, rms = _frame_features(y, sr, n_fft, hop_length, n_mels, max_frames)
+
+    mel_spec_db = 10.0 * np.log10(np.maximum(AMIN, mel_spec))
+    mel_spec_db -= 10.0 * np.log10(np.maximum(AMIN, mel_spec.max()))
+    mel_spec_db = np.maximum(mel_spec_db, mel_spec_db.max() - TOP_DB)
+
+    return np.vstack([mel_spec_db, zcr, spectral_flatness, rms]).astype(np.float32)
+
+
+def extract_stutter_windows(y, sr=16000, window_frames=100, hop_frames=50,
+                            n_fft=N_FFT, hop_length=HOP_LENGTH, n_mels=N_MELS):
+    """
+    Cuts the whole clip into overlapping window_frames-long feature windows, each one
+    shaped and normalized like extract_stutter_features(y_window, max_frames=window_frames).
+
+    The STFT is computed once for the full clip; the windows are strided views of it, and
+    only the dB reference (loudest frame) is recomputed per window.
+
+    :param hop_frames: Frames between the starts of consecutive windows.
+    :return: Array shaped (n_windows, n_mels + 3, window_frames). Clips shorter than one
+             window give a single zero-padded window; the last window is aligned to the
+             end of the clip so every frame is covered.
+    """
+    mel_spec, zcr, spectral_flatness, rms = _frame_features(y, sr, n_fft, hop_length, n_mels)
+    n_frames = mel_spec.shape[1]
+    if n_frames <= window_frames:
+        # a single window, zero padded the same way StutterCNN.extract_features pads
+        features = extract_stutter_features(y, sr, n_fft, hop_length, n_mels, max_frames=window_frames)
+        features = np.pad(features, ((0, 0), (0, window_frames - features.shape[1])), mode='constant')
+        return features[np.newaxis]
+
+    starts = _window_starts(n_frames, window_frames, hop_frames)
+
+    log_mel = 10.0 * np.log10(np.maximum(AMIN, mel_spec))
+    rows = np.vstack([log_mel, zcr, spectral_flatness, rms])
+    windows = np.lib.stride_tricks.sliding_window_view(rows, window_frames, axis=1)[:, starts]
+    windows = np.ascontiguousarray(windows.transpose(1, 0, 2), dtype=np.float32)
+
+    mel_db = windows[:, :n_mels]
+    mel_db -= np.maximum(10.0 * np.log10(AMIN), mel_db.max(axis=(1, 2), keepdims=True))
+    np.maximum(mel_db, mel_db.max(axis=(1, 2), keepdims=True) - TOP_DB, out=mel_db)
+    return windows
+
+
+def _window_starts(n_frames, window_frames, hop_frames):
+    starts = list(range(0, n_frames - window_frames + 1, hop_frames))
+    if starts[-1] + window_frames < n_frames:
+        starts.append(n_frames - window_frames)
+    return starts
+
+
+def _frame_features(y, sr, n_fft, hop_length, n_mels, max_frames=None):
+    # mel power spectrogram and the three per-frame rows, all from one framing of y
+    y = np.asarray(y, dtype=np.float32)
+    if max_frames is not None:
+        y = y[:window_samples(max_frames, n_fft, hop_length)]
+    frames = librosa.util.frame(np.pad(y, n_fft // 2, mode='constant'), frame_length=n_fft, hop_length=hop_length)
+    if max_frames is not None:
+        frames = frames[:, :max_frames]
+    n_frames = frames.shape[1]
+
+    power = np.abs(np.fft.rfft(frames * _window(n_fft)[:, None], axis=0)) ** 2
+    mel_spec = _mel_basis(sr, n_fft, n_mels) @ power
+
+    power_thresh = np.maximum(AMIN, power)
+    spectral_flatness = np.exp(np.mean(np.log(power_thresh), axis=0)) / np.mean(power_thresh, axis=0)  # Detects prolongation
+
+    rms = np.sqrt(np.einsum('ft,ft->t', frames, frames) / n_fft)
+
+    zcr = _zero_crossing_rate(y, n_fft, hop_length, n_frames)  # Detects blocking
+
+    return mel_spec, zcr, spectral_flatness, rms
+
+
+def reference_stutter_features(y, sr=16000):
+    """
+    The original per-feature librosa pipeline, kept for parity checks.
+    """
+    mel_spec = librosa.feature.melspectrogram(y=y, sr=sr)
+    mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
+    zcr = librosa.feature.zero_crossing_rate(y)
+    spectral_flatness = librosa.feature.spectral_flatness(y=y)
+    rms = librosa.feature.rms(y=y)
+    return np.vstack([mel_spec_db, zcr, spectral_flatness, rms])
+
+
+def reference_stutter_windows(y, sr=16000, window_frames=100, hop_frames=50, n_fft=N_FFT, hop_length=HOP_LENGTH):
+    """
+    Runs the librosa pipeline separately on the samples behind each window that
+    extract_stutter_windows produces, for parity checks of windowed scoring.
+
+    Each window is cut from the signal padded the way librosa centers frames (zeros for
+    the spectral rows, edge values for zero crossings) and framed with center=False, so
+    it sees exactly the frames of the full-clip framing it stands for.
+    """
+    n_frames = 1 + len(y) // hop_length
+    if n_frames <= window_frames:
+        reference = reference_stutter_features(y, sr)[:, :window_frames]
+        return np.pad(reference, ((0, 0), (0, window_frames - reference.shape[1])), mode='constant')[np.newaxis]
+
+    padded = np.pad(y, n_fft // 2, mode='constant')
+    edge_padded = np.pad(y, n_fft // 2, mode='edge')
+    span = (window_frames - 1) * hop_length + n_fft
+    windows = []
+    for start in _window_starts(n_frames, window_frames, hop_frames):
+        segment = padded[start * hop_length:start * hop_length + span]
+        mel_spec = librosa.feature.melspectrogram(y=segment, sr=sr, n_fft=n_fft, hop_length=hop_length, center=False)
+        windows.append(np.vstack([
+            librosa.power_to_db(mel_spec, ref=np.max),
+            librosa.feature.zero_crossing_rate(edge_padded[start * hop_length:start * hop_length + span],
+                                               frame_length=n_fft, hop_length=hop_length, center=False),
+            librosa.feature.spectral_flatness(y=segment, n_fft=n_fft, hop_length=hop_length, center=False),
+            librosa.feature.rms(y=segment, frame_length=n_fft, hop_length=hop_length, center=False),
+        ]))
+    return np.stack(windows)
+
+
+def check_parity(y, sr=16000, window_frames=100, atol=1e-3, rtol=1e-3):
+    """
+    Compares the fused extractor against the librosa pipeline row group by row group, for
+    each path that is served: the full clip, the first window (only for clips that fit in
+    it, since the dB reference is the loudest frame of the window) and windowed scoring.
+
+    :return: Dict of max absolute error per feature group for each path; raises
+             AssertionError on mismatch.
+    """
+    errors = {'full': _compare(extract_stutter_features(y, sr), reference_stutter_features(y, sr), 'full clip', atol, rtol)}
+    if len(y) <= window_samples(window_frames):
+        errors['first_window'] = _compare(extract_stutter_features(y, sr, max_frames=window_frames),
+                                          reference_stutter_features(y, sr)[:, :window_frames],
+                                          'first window', atol, rtol)
+    fused_windows = extract_stutter_windows(y, sr, window_frames=window_frames)
+    reference_windows = reference_stutter_windows(y, sr, window_frames=window_frames)
+    assert fused_windows.shape == reference_windows.shape, \
+        f"windows: shape mismatch {fused_windows.shape} != {reference_windows.shape}"
+    window_errors = [_compare(fused, reference, f"window {i}", atol, rtol)
+                     for i, (fused, reference) in enumerate(zip(fused_windows, reference_windows))]
+    errors['windows'] = {name: max(e[name] for e in window_errors) for name in window_errors[0]}
+    return errors
+
+
+def _compare(fused, reference, label, atol, rtol):
+    assert fused.shape == reference.shape, f"{label}: shape mismatch {fused.shape} != {reference.shape}"
+
+    groups = {'mel_db': slice(0, N_MELS), 'zcr': N_MELS, 'flatness': N_MELS + 1, 'rms': N_MELS + 2}
+    errors = {}
+    for name, rows in groups.items():
+        errors[name] = float(np.max(np.abs(fused[rows] - reference[rows])))
+        # dB values live on a ~80 dB scale, so compare them with an absolute tolerance in dB
+        tolerance = (1e-2, 0) if name == 'mel_db' else (atol, rtol)
+        assert np.allclose(fused[rows], reference[rows], atol=tolerance[0], rtol=tolerance[1]), \
+            f"{label}: {name} differs from librosa: max abs error {errors[name]}"
+    return errors
+
+
+if __name__ == '__main__':
+    # usage: python -m models.features [audio files...]
+    # with no arguments a few synthetic signals are checked
+    if len(sys.argv) > 1:
+        signals = [(path, librosa.load(path, sr=16000)[0]) for path in sys.argv[1:]]
+    else:
+        rng = np.random.default_rng(0)
+        t = np.arange(16000 * 4) / 16000
+        signals = [
+            ('noise', rng.standard_normal(16000 * 3).astype(np.float32) * 0.1),
+            ('chirp', (0.5 * np.sin(2 * np.pi * (200 + 400 * t) * t)).astype(np.float32)),
+            ('short', rng.standard_normal(700).astype(np.float32) * 0.01),
+            # fits in the first 100-frame window, so the first-window path is checked too
+            ('one window', rng.standard_normal(window_samples(100)).astype(np.float32) * 0.1),
+        ]
+    for name, y in signals:
+        print(name, check_parity(y))
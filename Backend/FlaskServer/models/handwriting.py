@@ -0,0 +1,69 @@
+import torch
+import torch.nn as nn
+import numpy as np
+from PIL import Image
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+# written by train_handwriting_model.py and loaded by image_rec.LocalHandwritingGrader
+HANDWRITING_MODEL_PATH = os.getenv('HANDWRITING_MODEL_PATH', '../Models/handwriting_cnn.pt')
+
+# label for photos that show none of the phrases (optional extra class in training data)
+OTHER_LABEL = 'other'
+
+
+class HandwritingCNN(nn.Module):
+    """
+    Small CNN that recognises which QUESTION_FIVE_PHRASES phrase a cropped photo of
+    handwriting shows. Question five always asks for one of a fixed set of phrases, so
+    "is this the expected phrase" becomes a classification over that set, and the softmax
+    probability of the expected phrase serves as the match confidence.
+
+    Input is (batch, 1, 64, 256): the writing scaled to fit, ink bright on a dark page.
+    """
+    INPUT_HEIGHT = 64
+    INPUT_WIDTH = 256
+
+    def __init__(self, n_classes):
+        super(HandwritingCNN, self).__init__()
+        self.features = nn.Sequential(
+            nn.Conv2d(1, 16, kernel_size=3, padding=1), nn.BatchNorm2d(16), nn.ReLU(), nn.MaxPool2d(2),
+            nn.Conv2d(16, 32, kernel_size=3, padding=1), nn.BatchNorm2d(32), nn.ReLU(), nn.MaxPool2d(2),
+            nn.Conv2d(32, 64, kernel_size=3, padding=1), nn.BatchNorm2d(64), nn.ReLU(), nn.MaxPool2d(2),
+            nn.Conv2d(64, 96, kernel_size=3, padding=1), nn.BatchNorm2d(96), nn.ReLU(),
+        )
+        # keeps some left-to-right layout (word order) instead of pooling everything away
+        self.pool = nn.AdaptiveAvgPool2d((1, 8))
+        self.dropout = nn.Dropout(0.3)
+        self.fc = nn.Linear(96 * 8, n_classes)
+
+    def forward(self, x):
+        x = self.features(x)
+        x = self.pool(x).flatten(1)
+        x = self.dropout(x)
+        return self.fc(x)
+
+    @staticmethod
+    def image_to_tensor(gray):
+        """
+        Fits a grayscale crop of the writing into the model's input size, keeping its
+        aspect ratio, and inverts it so ink is 1 and the page is 0.
+
+        :param gray: "L" mode PIL image, e.g. from image_preprocess.crop_handwriting.
+        :return: Tensor shaped (1, 64, 256).
+        """
+        height, width = HandwritingCNN.INPUT_HEIGHT, HandwritingCNN.INPUT_WIDTH
+        scale = min(height / gray.height, width / gray.width)
+        size = (max(int(gray.width * scale), 1), max(int(gray.height * scale), 1))
+        resized = gray.resize(size, Image.BILINEAR)
+
+        canvas = Image.new('L', (width, height), 255)
+        canvas.paste(resized, ((width - size[0]) // 2, (height - size[1]) // 2))
+        pixels = np.asarray(canvas, dtype=np.float32) / 255.0
+        # stretch contrast so a grey whiteboard and white paper look alike
+        low, high = pixels.min(), pixels.max()
+        if high - low > 1e-3:
+            pixels = (pixels - low) / (high - low)
+        return torch.from_numpy(1.0 - pixels).unsqueeze(0)
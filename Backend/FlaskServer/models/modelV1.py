@@ -2,6 +2,7 @@ import torch
 import torch.nn as nn
 import numpy as np
 import librosa
+from models.features import extract_stutter_features, extract_stutter_windows, window_samples
 
 class StutterCNN(nn.Module):
     def __init__(self):
@@ -27,27 +28,39 @@ class StutterCNN(nn.Module):
         x = self.fc2(x)
         return x
     
-    def extract_features(self, file_path, max_pad_length=100):
+    @staticmethod
+    def receptive_samples(max_pad_length=100):
+        # only the first max_pad_length frames reach the model, so audio past this many
+        # samples (about 3.2s at 16kHz) never needs to be decoded
+        return window_samples(max_pad_length)
+
+    @staticmethod
+    def extract_features(file_path, max_pad_length=100):
         y, sr = librosa.load(file_path, sr=16000)
+        return StutterCNN.extract_features_from_array(y, sr, max_pad_length)
+
+    @staticmethod
+    def extract_features_from_array(y, sr=16000, max_pad_length=100):
+        # same as extract_features but for a waveform that is already decoded in memory
         if len(y) == 0:
             #print(f"Warning: {file_path} is empty. Skipping.")
             return None
         
-        mel_spec = librosa.feature.melspectrogram(y=y, sr=sr)
-        mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
-            
-        zcr = librosa.feature.zero_crossing_rate(y)  # Detects blocking
-
-        spectral_flatness = librosa.feature.spectral_flatness(y=y)  # Detects prolongation
-
-        rms = librosa.feature.rms(y=y)
-        
-        features = np.vstack([mel_spec_db, zcr, spectral_flatness, rms])
+        # one stft/framing pass instead of separate librosa calls per feature,
+        # skipping frames that would be cut off below anyway
+        features = extract_stutter_features(y, sr, max_frames=max_pad_length)
         if features.shape[1] > max_pad_length:
             features = features[:, :max_pad_length]
         else:
             pad_width = max_pad_length - features.shape[1]
             features = np.pad(features, ((0, 0), (0, pad_width)), mode='constant') 
         return torch.tensor(features, dtype=torch.float32).unsqueeze(0)
-    
 
+    @staticmethod
+    def extract_windows_from_array(y, sr=16000, max_pad_length=100, hop_frames=50):
+        # overlapping max_pad_length-frame windows covering the whole clip, ready to be
+        # scored as one batch instead of only looking at the first ~3 seconds
+        if len(y) == 0:
+            return None
+        windows = extract_stutter_windows(y, sr, window_frames=max_pad_length, hop_frames=hop_frames)
+        return torch.from_numpy(windows).unsqueeze(1)
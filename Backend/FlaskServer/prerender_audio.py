@@ -0,0 +1,115 @@
+"""
+Renders every test and learning prompt to audio ahead of time so no student waits on
+ElevenLabs.
+
+    python prerender_audio.py --workers 4
+
+Rendered audio goes through the content-addressed TTS cache, so an interrupted run can
+simply be started again: prompts that are already rendered are skipped.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from data.words import QUESTION_ONE_WORDS, QUESTION_TWO_LETTERS, QUESTION_FIVE_PHRASES
+from text_to_speech import is_rendered, render_audio
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+
+DATABASE = "Database/user_data.sqlite"
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def question_bank_prompts(database=DATABASE):
+    """
+    Every prompt the app can ask for, as (text, target_path) pairs. target_path is where
+    the learning routes expect the file and is None for prompts only served from the cache.
+    Texts are normalized the same way the question routes normalize them.
+    """
+    prompts = [(word.lower(), None) for word in QUESTION_ONE_WORDS]
+    prompts += [(letter.lower(), None) for letter in QUESTION_TWO_LETTERS]
+    prompts += [(phrase, None) for phrase in QUESTION_FIVE_PHRASES]
+
+    if os.path.exists(database):
+        db = sqlite3.connect(database)
+        try:
+            rows = db.execute("SELECT question_text, question_audio_path FROM learning_questions;").fetchall()
+        finally:
+            db.close()
+        prompts += [(text, os.path.join(ROOT, path) if path else None) for text, path in rows]
+
+    # keep the first occurrence of each (text, target) pair
+    return list(dict.fromkeys(prompts))
+
+
+def _copy_atomic(source, target):
+    folder = os.path.dirname(target)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+    os.close(fd)
+    try:
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def prerender_prompt(text, target_path=None):
+    """
+    Renders one prompt unless it is already done.
+
+    :return: True if audio was rendered or copied, False if it was skipped.
+    """
+    if is_rendered(text) and (target_path is None or os.path.exists(target_path)):
+        return False
+    path = render_audio(text)
+    if target_path is not None and not os.path.exists(target_path):
+        _copy_atomic(path, target_path)
+    return True
+
+
+def prerender_all(database=DATABASE, workers=4):
+    """
+    Renders the whole question bank with at most `workers` concurrent TTS requests.
+
+    :return: (rendered, skipped, failed) counts.
+    """
+    prompts = question_bank_prompts(database)
+    rendered = skipped = failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(prerender_prompt, text, target): text for text, target in prompts}
+        for future in as_completed(futures):
+            try:
+                if future.result():
+                    rendered += 1
+                else:
+                    skipped += 1
+            except Exception as e:
+                failed += 1
+                print(f"Pre-rendering failed for '{futures[future]}': {e}")
+    print(f"Pre-rendered {rendered} prompts, skipped {skipped}, failed {failed}")
+    return rendered, skipped, failed
+
+
+def start_prerender_in_background(database=DATABASE, workers=4):
+    """
+    Runs prerender_all on a daemon thread so server startup is not blocked.
+    """
+    thread = threading.Thread(target=prerender_all, args=(database, workers), name='tts-prerender', daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=DATABASE)
+    parser.add_argument('--workers', type=int, default=4, help='max concurrent TTS requests')
+    args = parser.parse_args()
+
+    _, _, failed = prerender_all(args.database, args.workers)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,110 @@
+"""
+Builds the int8 serving version of StutterCNN and compares it with the fp32 checkpoint.
+
+    python quantize_model.py                                   # build + report on random inputs
+    python quantize_model.py --clips ../data/clips/stuttering-clips/clips/ \
+                             --labels ../data/normalized_data.csv           # report accuracy too
+
+The Linear layers (fc1 holds ~6.5M of the model's weights) are dynamically quantized to
+int8, then the model is traced to TorchScript so the server can load it without the
+Python class. Set STUTTER_MODEL_QUANTIZED=1 to serve it.
+"""
+from models.modelV1 import StutterCNN
+from model_registry import STUTTER_MODEL_PATH, STUTTER_QUANTIZED_MODEL_PATH, STUTTER_INPUT_SHAPE
+import argparse
+import csv
+import os
+import time
+import numpy as np
+import torch
+
+
+def build_quantized_model(checkpoint_path=STUTTER_MODEL_PATH, output_path=STUTTER_QUANTIZED_MODEL_PATH):
+    """
+    Quantizes the fp32 checkpoint's Linear layers to int8 and saves a traced TorchScript module.
+
+    :return: (fp32 model, quantized scripted model)
+    """
+    model = StutterCNN()
+    model.load_state_dict(torch.load(checkpoint_path, map_location='cpu'))
+    model.eval()
+
+    quantized = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    with torch.inference_mode():
+        scripted = torch.jit.trace(quantized, torch.zeros((1,) + STUTTER_INPUT_SHAPE))
+    torch.jit.save(scripted, output_path)
+    print(f"Saved quantized model to {output_path} "
+          f"({os.path.getsize(output_path) / 1e6:.1f} MB, fp32 checkpoint {os.path.getsize(checkpoint_path) / 1e6:.1f} MB)")
+    return model, scripted
+
+
+def load_features(clips_folder, labels_path, limit):
+    # same layout as StutterDataset in stutter_detection_training.ipynb: fil_name,label rows
+    features, labels = [], []
+    with open(labels_path) as f:
+        for row in csv.DictReader(f):
+            sample = StutterCNN.extract_features(os.path.join(clips_folder, row['fil_name']))
+            if sample is None:
+                continue
+            features.append(sample)
+            labels.append(int(row['label']))
+            if len(features) >= limit:
+                break
+    return torch.stack(features), torch.tensor(labels)
+
+
+def time_model(model, batch, runs):
+    timings = []
+    with torch.inference_mode():
+        model(batch)
+        for _ in range(runs):
+            start = time.perf_counter()
+            model(batch)
+            timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, 50), np.percentile(timings, 99)
+
+
+def compare(model, quantized, features, labels=None, runs=50):
+    """
+    Prints prediction agreement, logit error, accuracy (when labels are given) and
+    batch-1 / batch-16 latency for the fp32 and int8 models.
+    """
+    with torch.inference_mode():
+        fp32_logits = torch.cat([model(batch) for batch in features.split(64)])
+        int8_logits = torch.cat([quantized(batch) for batch in features.split(64)])
+    fp32_predicted = fp32_logits.argmax(dim=1)
+    int8_predicted = int8_logits.argmax(dim=1)
+
+    print(f"Samples: {len(features)}")
+    print(f"Prediction agreement: {100 * (fp32_predicted == int8_predicted).float().mean():.2f}%")
+    print(f"Max logit difference: {(fp32_logits - int8_logits).abs().max():.4f}")
+    if labels is not None:
+        print(f"fp32 accuracy: {100 * (fp32_predicted == labels).float().mean():.2f}%")
+        print(f"int8 accuracy: {100 * (int8_predicted == labels).float().mean():.2f}%")
+
+    for batch_size in (1, 16):
+        batch = features[:batch_size]
+        if len(batch) < batch_size:
+            batch = batch.repeat(batch_size, 1, 1, 1)[:batch_size]
+        fp32_p50, fp32_p99 = time_model(model, batch, runs)
+        int8_p50, int8_p99 = time_model(quantized, batch, runs)
+        print(f"batch {batch_size:2d}  fp32 p50 {fp32_p50:.2f}ms p99 {fp32_p99:.2f}ms  |  "
+              f"int8 p50 {int8_p50:.2f}ms p99 {int8_p99:.2f}ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', default=STUTTER_MODEL_PATH)
+    parser.add_argument('--output', default=STUTTER_QUANTIZED_MODEL_PATH)
+    parser.add_argument('--clips', help='folder of labelled clips for the accuracy report')
+    parser.add_argument('--labels', help='csv with fil_name,label columns')
+    parser.add_argument('--limit', type=int, default=500, help='max clips to evaluate')
+    parser.add_argument('--runs', type=int, default=50, help='timed runs per latency measurement')
+    args = parser.parse_args()
+
+    model, quantized = build_quantized_model(args.checkpoint, args.output)
+    if args.clips and args.labels:
+        features, labels = load_features(args.clips, args.labels, args.limit)
+    else:
+        features, labels = torch.randn((64,) + STUTTER_INPUT_SHAPE), None
+    compare(model, quantized, features, labels, args.runs)
@@ -0,0 +1,61 @@
+from collections import OrderedDict
+import hashlib
+import threading
+
+
+class ResultCache:
+    """
+    In-memory LRU cache of results computed from uploaded audio, keyed by a hash of the
+    upload's bytes. An app retry or a re-submitted clip is then answered without calling
+    Whisper or running the CNN again. Holds at most max_entries results; the least
+    recently used one is dropped first.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(data, *parts):
+        """
+        Fingerprints a recording together with whatever else changes the result (backend,
+        scoring mode, ...).
+
+        :param data: The upload's bytes, or a binary file object, which is hashed in
+                     chunks and rewound so spooled uploads are not pulled into memory.
+        """
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            digest = hashlib.sha256(data)
+        else:
+            digest = hashlib.sha256()
+            data.seek(0)
+            for chunk in iter(lambda: data.read(64 * 1024), b''):
+                digest.update(chunk)
+            data.seek(0)
+        for part in parts:
+            digest.update(b'\x1f' + str(part).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached result for key, or None on a miss.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
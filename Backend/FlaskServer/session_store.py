@@ -0,0 +1,290 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dotenv import load_dotenv
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+load_dotenv()
+
+# "memory" keeps sessions in this process, "sqlite" shares them between worker processes
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'memory')
+SESSION_DATABASE = os.getenv('SESSION_DATABASE', 'Database/sessions.sqlite')
+# tests untouched for this long are dropped
+SESSION_TTL_SECONDS = float(os.getenv('SESSION_TTL_SECONDS', '3600'))
+SESSION_MAX_SESSIONS = int(os.getenv('SESSION_MAX_SESSIONS', '10000'))
+
+# columns of the data table a finished test is saved to, in insert order
+RESULT_FIELDS = (
+    'username', 'class_name', 'question1', 'question2', 'question3', 'question4', 'question5',
+    'spelling_accuracy', 'stutter_metric', 'speaking_accuracy', 'handwriting_metric', 'total_score', 'difficulty_level',
+)
+
+# the prompt each question was asked with, used to grade the answer
+ANSWER_FIELDS = ('answer1', 'answer2', 'answer3', 'answer4', 'answer5')
+
+
+class SessionState:
+    """
+    Everything one in-progress test needs: the graded results plus the expected answers.
+    Slotted so each session is a handful of attribute slots rather than a pandas row.
+    """
+    __slots__ = RESULT_FIELDS + ANSWER_FIELDS + ('jobs', 'updated_at')
+
+    def __init__(self, username, class_name):
+        for field in RESULT_FIELDS + ANSWER_FIELDS:
+            setattr(self, field, None)
+        self.username = username
+        self.class_name = class_name
+        self.difficulty_level = 0
+        # background grading jobs: job_id -> {'question', 'status', 'error', 'result'}
+        self.jobs = {}
+        self.updated_at = time.time()
+
+    def result_row(self):
+        """
+        Results as a tuple in RESULT_FIELDS order, ready for the data table insert.
+        """
+        return tuple(getattr(self, field) for field in RESULT_FIELDS)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, values):
+        state = cls.__new__(cls)
+        for field in cls.__slots__:
+            setattr(state, field, values.get(field))
+        if state.jobs is None:
+            state.jobs = {}
+        return state
+
+    def pending_jobs(self):
+        return [job_id for job_id, job in self.jobs.items() if job['status'] == 'pending']
+
+
+class SessionStore(ABC):
+    """
+    Interface for stores of in-progress tests keyed by the session id /start hands out.
+
+    Sessions not saved for ttl_seconds are evicted, and at most max_sessions are kept
+    (least recently updated go first), so abandoned tests cannot grow memory forever.
+    """
+
+    def __init__(self, ttl_seconds=SESSION_TTL_SECONDS, max_sessions=SESSION_MAX_SESSIONS):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+
+    def create(self, username, class_name):
+        """
+        Starts a test and returns (session_id, state).
+        """
+        session_id = secrets.token_urlsafe(16)
+        state = SessionState(username, class_name)
+        self._insert(session_id, state)
+        return session_id, state
+
+    @abstractmethod
+    def get(self, session_id):
+        """
+        Returns the session's state, or None if it does not exist or has expired.
+        """
+
+    @abstractmethod
+    def save(self, session_id, state):
+        """
+        Persists changes made to a state returned by get() and refreshes its TTL.
+        """
+
+    @abstractmethod
+    def update(self, session_id, apply):
+        """
+        Atomically loads the session, calls apply(state) and saves it, so concurrent writers
+        (e.g. background grading jobs) cannot overwrite each other's fields.
+
+        :return: The updated state, or None if the session does not exist.
+        """
+
+    @abstractmethod
+    def pop(self, session_id):
+        """
+        Removes a session and returns its state, or None.
+        """
+
+    @abstractmethod
+    def only_session_id(self):
+        """
+        The id of the one test in progress, or None if there are none or several. Only for
+        clients that do not send a session id yet: with more than one test running there is
+        no telling whose request it is.
+        """
+
+    @abstractmethod
+    def _insert(self, session_id, state):
+        """
+        Stores a newly created session.
+        """
+
+    def _is_expired(self, state, now=None):
+        return (now or time.time()) - state.updated_at > self.ttl_seconds
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Sessions held in this process. Kept in an OrderedDict ordered by last update, so TTL
+    and size eviction only ever look at the oldest entries.
+    """
+
+    def __init__(self, ttl_seconds=SESSION_TTL_SECONDS, max_sessions=SESSION_MAX_SESSIONS):
+        super().__init__(ttl_seconds, max_sessions)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            self._evict()
+            return self._sessions.get(session_id)
+
+    def save(self, session_id, state):
+        state.updated_at = time.time()
+        with self._lock:
+            if session_id in self._sessions:
+                self._sessions[session_id] = state
+                self._sessions.move_to_end(session_id)
+
+    def update(self, session_id, apply):
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                return None
+            apply(state)
+            state.updated_at = time.time()
+            self._sessions.move_to_end(session_id)
+            return state
+
+    def pop(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None)
+
+    def only_session_id(self):
+        with self._lock:
+            self._evict()
+            return next(iter(self._sessions)) if len(self._sessions) == 1 else None
+
+    def _insert(self, session_id, state):
+        with self._lock:
+            self._sessions[session_id] = state
+            self._evict()
+
+    def _evict(self):
+        now = time.time()
+        while self._sessions:
+            session_id, state = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and not self._is_expired(state, now):
+                break
+            del self._sessions[session_id]
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessions in a local SQLite file that every worker process on the machine opens, so a
+    student's requests can land on any worker. WAL mode lets readers and the writer run
+    concurrently; each thread keeps its own connection.
+    """
+
+    def __init__(self, path=SESSION_DATABASE, ttl_seconds=SESSION_TTL_SECONDS, max_sessions=SESSION_MAX_SESSIONS):
+        super().__init__(ttl_seconds, max_sessions)
+        self.path = path
+        self._local = threading.local()
+        db = self._db()
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+        """)
+        db.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at);")
+        db.commit()
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL;")
+            db.execute("PRAGMA synchronous=NORMAL;")
+            self._local.db = db
+        return db
+
+    def get(self, session_id):
+        row = self._db().execute(
+            "SELECT state FROM sessions WHERE session_id = ? AND updated_at >= ?;",
+            (session_id, time.time() - self.ttl_seconds)).fetchone()
+        return SessionState.from_dict(json.loads(row[0])) if row else None
+
+    def save(self, session_id, state):
+        state.updated_at = time.time()
+        db = self._db()
+        db.execute("UPDATE sessions SET state = ?, updated_at = ? WHERE session_id = ?;",
+                   (json.dumps(state.to_dict()), state.updated_at, session_id))
+        db.commit()
+
+    def update(self, session_id, apply):
+        db = self._db()
+        # take the write lock before reading so no other worker can save in between
+        db.execute("BEGIN IMMEDIATE;")
+        try:
+            state = self.get(session_id)
+            if state is not None:
+                apply(state)
+                state.updated_at = time.time()
+                db.execute("UPDATE sessions SET state = ?, updated_at = ? WHERE session_id = ?;",
+                           (json.dumps(state.to_dict()), state.updated_at, session_id))
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        return state
+
+    def pop(self, session_id):
+        state = self.get(session_id)
+        db = self._db()
+        db.execute("DELETE FROM sessions WHERE session_id = ?;", (session_id,))
+        db.commit()
+        return state
+
+    def only_session_id(self):
+        # two rows are enough to know it is not the only one
+        rows = self._db().execute(
+            "SELECT session_id FROM sessions WHERE updated_at >= ? LIMIT 2;",
+            (time.time() - self.ttl_seconds,)).fetchall()
+        return rows[0][0] if len(rows) == 1 else None
+
+    def _insert(self, session_id, state):
+        db = self._db()
+        db.execute("INSERT INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?);",
+                   (session_id, json.dumps(state.to_dict()), state.updated_at))
+        self._evict(db)
+        db.commit()
+
+    def _evict(self, db):
+        db.execute("DELETE FROM sessions WHERE updated_at < ?;", (time.time() - self.ttl_seconds,))
+        db.execute("""
+            DELETE FROM sessions WHERE session_id IN (
+                SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+            );
+        """, (self.max_sessions,))
+
+
+def create_session_store(backend=SESSION_BACKEND):
+    """
+    Builds the session store selected by SESSION_BACKEND.
+    """
+    if backend == 'sqlite':
+        return SQLiteSessionStore()
+    if backend == 'memory':
+        return MemorySessionStore()
+    raise ValueError(f"Unknown session backend: {backend}")
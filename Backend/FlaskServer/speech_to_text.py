@@ -1,20 +1,222 @@
 from openai import OpenAI
 from dotenv import load_dotenv
+from vendor_calls import whisper_service, ServiceError
+from inference_batcher import MicroBatcher
+from audio_decode import prepare_speech, encode_audio
+from result_cache import ResultCache
+from abc import ABC, abstractmethod
 import os
+import subprocess
+import threading
+import torch
 
 load_dotenv()
 
+# "openai" sends recordings to whisper-1, "local" transcribes them on this machine's CPU.
+# "local" also needs torchaudio, which is left out of requirements.txt because it has to
+# match the installed torch build: pip install torchaudio==<your torch version>
+STT_BACKEND = os.getenv('STT_BACKEND', 'openai')
+# any CTC bundle in torchaudio.pipelines, e.g. WAV2VEC2_ASR_LARGE_960H for better accuracy
+STT_LOCAL_BUNDLE = os.getenv('STT_LOCAL_BUNDLE', 'WAV2VEC2_ASR_BASE_960H')
+STT_LOCAL_MAX_SECONDS = float(os.getenv('STT_LOCAL_MAX_SECONDS', '15'))
+STT_LOCAL_MAX_BATCH_SIZE = int(os.getenv('STT_LOCAL_MAX_BATCH_SIZE', '8'))
+STT_LOCAL_MAX_WAIT_MS = float(os.getenv('STT_LOCAL_MAX_WAIT_MS', '10'))
+# trim silence and re-encode recordings as 16 kHz mono Opus before uploading them to Whisper
+STT_UPLOAD_REENCODE = os.getenv('STT_UPLOAD_REENCODE', '1') == '1'
+# transcripts remembered per recording, 0 disables the cache
+STT_CACHE_MAX_ENTRIES = int(os.getenv('STT_CACHE_MAX_ENTRIES', '1024'))
+
 client = OpenAI(
-    api_key = os.getenv('OPENAI_API_KEY')
+    api_key = os.getenv('OPENAI_API_KEY'),
+    timeout = whisper_service.timeout,
+    # retries are whisper_service's job; SDK retries would outlive its deadline
+    max_retries = 0,
 )
 
-def transcribe_audio(filepath):
-    audio_file = open(filepath, "rb")
-    try:    
+_transcriber = None
+_transcriber_lock = threading.Lock()
+
+transcription_cache = ResultCache(STT_CACHE_MAX_ENTRIES)
+
+
+class Transcriber(ABC):
+    """
+    Interface for speech-to-text backends.
+    """
+
+    @abstractmethod
+    def transcribe(self, audio, filename):
+        """
+        :param audio: A file path, or a file-like object / bytes holding the recording.
+        :param filename: Name of the recording, its extension tells the format.
+        :return: The transcribed text.
+        """
+
+
+class OpenAITranscriber(Transcriber):
+    """
+    Whisper through the OpenAI API, bounded by whisper_service.
+    """
+
+    def transcribe(self, audio, filename):
+        if STT_UPLOAD_REENCODE:
+            try:
+                waveform = prepare_speech(_read_audio(audio))
+                encoded = encode_audio(waveform) if len(waveform) else None
+            except (ValueError, OSError, subprocess.CalledProcessError) as e:
+                # e.g. ffmpeg missing or built without libopus: let Whisper try the
+                # original file rather than failing on our decoder
+                print(f"Could not preprocess recording, uploading it as is: {e}")
+            else:
+                if encoded is None:
+                    # nothing above the silence threshold; Whisper tends to invent words for silence
+                    return ""
+                audio, filename = encoded, 'audio.ogg'
+        if whisper_service.hedge_after is not None and not isinstance(audio, (str, bytes)):
+            # hedged attempts would race on the shared file position, give them immutable bytes
+            audio.seek(0)
+            audio = audio.read()
+        return whisper_service.call(self._transcribe, audio, filename)
+
+    @staticmethod
+    def _transcribe(audio, filename):
+        if isinstance(audio, str):
+            # each attempt opens its own handle so hedged attempts do not share a file position
+            with open(audio, "rb") as audio_file:
+                transcription = client.audio.transcriptions.create(
+                    model="whisper-1",
+                    file=audio_file,
+                    timeout=whisper_service.remaining(),
+                )
+            return transcription.text
+
+        if hasattr(audio, 'seek'):
+            audio.seek(0)
         transcription = client.audio.transcriptions.create(
             model="whisper-1",
-            file=audio_file
+            file=(filename, audio),
+            timeout=whisper_service.remaining(),
         )
         return transcription.text
+
+
+class LocalCTCTranscriber(Transcriber):
+    """
+    wav2vec2 CTC model from torchaudio (the WAV2VEC2_ASR_BASE_960H bundle explored in
+    stutter_detection_training.ipynb) with greedy decoding, run on the CPU.
+
+    The model is loaded once per process. Concurrent requests are zero-padded to the
+    longest recording and share one forward pass through a MicroBatcher; each row's
+    emissions are only decoded up to its own length.
+    """
+
+    def __init__(self, bundle_name=STT_LOCAL_BUNDLE, max_seconds=STT_LOCAL_MAX_SECONDS,
+                 max_batch_size=STT_LOCAL_MAX_BATCH_SIZE, max_wait_ms=STT_LOCAL_MAX_WAIT_MS):
+        # optional dependency, only needed when this backend is selected
+        try:
+            import torchaudio
+        except ImportError as e:
+            raise ImportError("STT_BACKEND=local needs torchaudio built for the installed torch, "
+                              "e.g. pip install torchaudio==" + torch.__version__.split('+')[0]) from e
+
+        bundle = getattr(torchaudio.pipelines, bundle_name)
+        self.sample_rate = bundle.sample_rate
+        self.max_samples = int(max_seconds * self.sample_rate)
+        self.labels = bundle.get_labels()
+        self.model = bundle.get_model()
+        self.model.eval()
+        with torch.inference_mode():
+            self.model(torch.zeros(1, self.sample_rate))
+        self.batcher = MicroBatcher(self._predict, max_batch_size=max_batch_size,
+                                    max_wait_ms=max_wait_ms, collate_fn=self._collate)
+        print(f"Local speech-to-text model {bundle_name} loaded")
+
+    def transcribe(self, audio, filename):
+        waveform = prepare_speech(_read_audio(audio), sample_rate=self.sample_rate,
+                                  max_samples=self.max_samples, max_input_samples=4 * self.max_samples)
+        if len(waveform) == 0:
+            return ""
+        return self.batcher.predict(torch.from_numpy(waveform.copy()))
+
+    @staticmethod
+    def _collate(waveforms):
+        lengths = torch.tensor([len(waveform) for waveform in waveforms])
+        batch = torch.zeros(len(waveforms), int(lengths.max()))
+        for row, waveform in enumerate(waveforms):
+            batch[row, :len(waveform)] = waveform
+        return batch, lengths
+
+    def _predict(self, inputs):
+        batch, lengths = inputs
+        with torch.inference_mode():
+            emissions, frame_lengths = self.model(batch, lengths)
+        if frame_lengths is None:
+            frame_lengths = torch.full((len(batch),), emissions.shape[1])
+        tokens = emissions.argmax(dim=-1)
+        return [self._decode(tokens[row, :int(frame_lengths[row])]) for row in range(len(batch))]
+
+    def _decode(self, tokens):
+        # greedy CTC: collapse repeats, then drop blanks (label 0); "|" separates words
+        tokens = torch.unique_consecutive(tokens).tolist()
+        text = ''.join(self.labels[token] for token in tokens if token != 0)
+        return ' '.join(text.replace('|', ' ').split()).lower()
+
+
+def _read_audio(audio):
+    if isinstance(audio, bytes):
+        return audio
+    if isinstance(audio, str):
+        with open(audio, 'rb') as f:
+            return f.read()
+    audio.seek(0)
+    return audio.read()
+
+
+def _fingerprint(audio):
+    model = STT_LOCAL_BUNDLE if STT_BACKEND == 'local' else 'whisper-1'
+    if isinstance(audio, str):
+        with open(audio, 'rb') as f:
+            return ResultCache.make_key(f, STT_BACKEND, model)
+    return ResultCache.make_key(audio, STT_BACKEND, model)
+
+
+def create_transcriber(backend=STT_BACKEND):
+    """
+    Builds the speech-to-text backend selected by STT_BACKEND.
+    """
+    if backend == 'local':
+        return LocalCTCTranscriber()
+    if backend == 'openai':
+        return OpenAITranscriber()
+    raise ValueError(f"Unknown speech-to-text backend: {backend}")
+
+
+def get_transcriber():
+    """
+    Returns the process-wide transcriber, loading it on first use.
+    """
+    global _transcriber
+    if _transcriber is None:
+        with _transcriber_lock:
+            if _transcriber is None:
+                _transcriber = create_transcriber()
+    return _transcriber
+
+
+def transcribe_audio(audio, filename="audio.m4a"):
+    """
+    :param audio: A file path, or a file-like object / bytes holding the recording.
+    :param filename: Name the recording is sent under when audio is not a path; Whisper
+                     detects the format from its extension.
+    """
+    try:
+        key = _fingerprint(audio)
+        text = transcription_cache.get(key)
+        if text is None:
+            text = get_transcriber().transcribe(audio, filename)
+            transcription_cache.put(key, text)
+        return text
+    except ServiceError:
+        raise
     except Exception as e:
         raise ValueError(f"Transcription failed: {str(e)}")
@@ -1,30 +1,129 @@
 from dotenv import load_dotenv
 from elevenlabs.client import ElevenLabs
-from elevenlabs import play, save
+from tts_cache import AudioCache
+from vendor_calls import tts_service
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import math
 import os
 
 load_dotenv()
 
 client = ElevenLabs(
     api_key=os.getenv("ELEVENLABS_API_KEY"),
+    timeout=tts_service.timeout,
 )
 
-def create_audio(app, text, filename="output.mp3"):
-    audio_folder = os.path.join(app.static_folder, 'tts')
-    
-    # make dir if not exists
-    if not os.path.exists(audio_folder):
-        os.makedirs(audio_folder)
-    
-    filepath = os.path.join(audio_folder, filename)
-    
-    audio = client.text_to_speech.convert(
+VOICE_ID = "56AoDkrOh6qfVPDXZ7Pt"
+MODEL_ID = "eleven_flash_v2"
+OUTPUT_FORMAT = "mp3_22050_32"
+
+TTS_CACHE_FOLDER = os.getenv('TTS_CACHE_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static/tts/cache'))
+TTS_CACHE_MAX_MB = float(os.getenv('TTS_CACHE_MAX_MB', '200'))
+
+# forward audio to the client as ElevenLabs produces it instead of after the whole file is saved
+TTS_STREAMING = os.getenv('TTS_STREAMING', '1') == '1'
+
+TTS_PREFETCH_WORKERS = int(os.getenv('TTS_PREFETCH_WORKERS', '8'))
+
+audio_cache = AudioCache(TTS_CACHE_FOLDER, int(TTS_CACHE_MAX_MB * 1024 * 1024))
+prefetch_executor = ThreadPoolExecutor(max_workers=TTS_PREFETCH_WORKERS, thread_name_prefix='tts-prefetch')
+
+
+def audio_key(text):
+    return AudioCache.make_key(text, VOICE_ID, MODEL_ID, OUTPUT_FORMAT)
+
+
+def is_rendered(text):
+    """
+    True if text is already in the audio cache.
+    """
+    return audio_cache.get(audio_key(text)) is not None
+
+
+def render_audio(text):
+    """
+    Returns the path of an mp3 of text, rendering it with ElevenLabs only if the same
+    (text, voice, model, format) has not been rendered before.
+    """
+    return audio_cache.get_or_create(audio_key(text), lambda: [tts_service.call(_convert, text)])
+
+
+def _convert(text):
+    # convert() streams lazily, so read the whole response inside the bounded call
+    return b''.join(client.text_to_speech.convert(
+        text=text,
+        voice_id=VOICE_ID,
+        model_id=MODEL_ID,
+        output_format=OUTPUT_FORMAT,
+        request_options=_request_options(),
+        ))
+
+
+def cached_audio(text):
+    """
+    Path of the cached mp3 of text, or None if it has not been rendered yet.
+    """
+    return audio_cache.get(audio_key(text))
+
+
+def stream_audio(text):
+    """
+    Returns an iterator of mp3 chunks of text that yields them as they arrive from
+    ElevenLabs, teeing them into the audio cache so the next request is a cache hit.
+
+    The first chunk is fetched before returning, so vendor errors and timeouts are raised
+    here (and can still become an error response) rather than partway through a body.
+    """
+    chunks = audio_cache.stream(audio_key(text), lambda: tts_service.call(_open_stream, text))
+    first = next(chunks, b'')
+    return _prepend(first, chunks)
+
+
+def _open_stream(text):
+    # runs under the TTS deadline until the first chunk is in; the rest is read by the caller
+    chunks = iter(client.text_to_speech.stream(
         text=text,
-        voice_id="56AoDkrOh6qfVPDXZ7Pt",
-        model_id="eleven_flash_v2",
-        output_format="mp3_22050_32",
-        )
+        voice_id=VOICE_ID,
+        model_id=MODEL_ID,
+        output_format=OUTPUT_FORMAT,
+        request_options=_request_options(),
+        ))
+    first = next(chunks, b'')
+    return itertools.chain([first], chunks)
+
+
+def _request_options():
+    # the same deadline as tts_service, so an abandoned call frees its worker; retries are tts_service's job
+    return {'timeout_in_seconds': math.ceil(tts_service.remaining()), 'max_retries': 0}
+
+
+def _prepend(first, chunks):
+    try:
+        yield first
+        yield from chunks
+    finally:
+        # lets the cache drop its partial file if the client went away
+        chunks.close()
+
+
+def prefetch_audio(texts):
+    """
+    Starts rendering texts in the background and returns their futures. A later
+    render_audio/create_audio call for the same text either hits the cache or waits on
+    the render already in flight (the cache only renders each key once), so callers do
+    not need to keep the futures around.
+    """
+    return [prefetch_executor.submit(render_audio, text) for text in texts]
+
+
+def create_audio(app, text, filename="output.mp3"):
+    """
+    Flask-facing wrapper around render_audio.
+
+    :param filename: Kept for callers that name the download; the audio itself lives in the cache.
+    """
+    filepath = render_audio(text)
     print(filepath)
-    save(audio, filepath)
-    
+
     return filepath
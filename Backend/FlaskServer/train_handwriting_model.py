@@ -0,0 +1,146 @@
+"""
+Trains the local handwriting model served with HANDWRITING_BACKEND=local.
+
+    python train_handwriting_model.py --data ../data/handwriting --epochs 30
+
+--data holds one folder per QUESTION_FIVE_PHRASES phrase, named exactly like the phrase
+(e.g. "Hello World/"), with photos of the phrase being written. An optional "other/"
+folder of writing that matches none of the phrases teaches the model to say no to it.
+Photos go through the same crop as at serving time, so raw phone pictures are fine.
+"""
+from models.handwriting import HandwritingCNN, HANDWRITING_MODEL_PATH, OTHER_LABEL
+from image_preprocess import crop_handwriting
+from data.words import QUESTION_FIVE_PHRASES
+import argparse
+import os
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+
+def load_dataset(folder):
+    """
+    Crops every photo once up front.
+
+    :return: (inputs shaped (n, 1, 64, 256), labels, class names)
+    """
+    classes = sorted(name for name in os.listdir(folder) if os.path.isdir(os.path.join(folder, name)))
+    unknown = [name for name in classes if name not in QUESTION_FIVE_PHRASES and name != OTHER_LABEL]
+    if unknown:
+        print(f"Warning: folders that are not question five phrases: {unknown}")
+
+    inputs, labels = [], []
+    for label, name in enumerate(classes):
+        for file_name in sorted(os.listdir(os.path.join(folder, name))):
+            if not file_name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            with open(os.path.join(folder, name, file_name), 'rb') as f:
+                try:
+                    inputs.append(HandwritingCNN.image_to_tensor(crop_handwriting(f.read())))
+                except ValueError as e:
+                    print(f"Skipping {name}/{file_name}: {e}")
+                    continue
+            labels.append(label)
+    return torch.stack(inputs), torch.tensor(labels), classes
+
+
+def augment(batch):
+    """
+    Random small rotation, scale, shift and contrast, so a few dozen photos per phrase
+    go further. Runs on whole batches with affine_grid, no extra dependencies.
+    """
+    n = batch.size(0)
+    angle = (torch.rand(n) - 0.5) * (2 * np.pi * 6 / 360)
+    scale = 1 + (torch.rand(n) - 0.5) * 0.2
+    shift = (torch.rand(n, 2) - 0.5) * 0.1
+    theta = torch.zeros(n, 2, 3)
+    theta[:, 0, 0] = torch.cos(angle) / scale
+    theta[:, 0, 1] = -torch.sin(angle) / scale
+    theta[:, 1, 0] = torch.sin(angle) / scale
+    theta[:, 1, 1] = torch.cos(angle) / scale
+    theta[:, :, 2] = shift
+    grid = F.affine_grid(theta, batch.shape, align_corners=False)
+    batch = F.grid_sample(batch, grid, align_corners=False)
+    contrast = 0.7 + torch.rand(n, 1, 1, 1) * 0.6
+    return (batch * contrast).clamp(0, 1)
+
+
+def evaluate(model, inputs, labels):
+    model.eval()
+    with torch.inference_mode():
+        predictions = model(inputs).argmax(dim=1)
+    return (predictions == labels).float().mean().item() if len(labels) else float('nan')
+
+
+def train(inputs, labels, classes, epochs=30, batch_size=32, lr=1e-3, val_split=0.2, seed=0):
+    """
+    :return: The model with the best validation accuracy seen, and that accuracy.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    order = torch.randperm(len(labels), generator=generator)
+    n_val = int(len(labels) * val_split)
+    val_idx, train_idx = order[:n_val], order[n_val:]
+
+    torch.manual_seed(seed)
+    model = HandwritingCNN(len(classes))
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+    criterion = nn.CrossEntropyLoss()
+    best_state, best_accuracy = None, -1.0
+
+    for epoch in range(epochs):
+        model.train()
+        running_loss = 0.0
+        shuffled = train_idx[torch.randperm(len(train_idx), generator=generator)]
+        for start in range(0, len(shuffled), batch_size):
+            batch = shuffled[start:start + batch_size]
+            optimizer.zero_grad()
+            loss = criterion(model(augment(inputs[batch])), labels[batch])
+            loss.backward()
+            optimizer.step()
+            running_loss += loss.item() * len(batch)
+
+        accuracy = evaluate(model, inputs[val_idx], labels[val_idx]) if n_val else evaluate(model, inputs, labels)
+        print(f"Epoch {epoch + 1}/{epochs}, loss: {running_loss / len(train_idx):.4f}, val accuracy: {accuracy:.3f}")
+        if accuracy >= best_accuracy:
+            best_accuracy = accuracy
+            best_state = {name: tensor.clone() for name, tensor in model.state_dict().items()}
+
+    model.load_state_dict(best_state)
+    model.eval()
+    return model, best_accuracy
+
+
+def time_model(model, runs=50):
+    sample = torch.zeros(1, 1, HandwritingCNN.INPUT_HEIGHT, HandwritingCNN.INPUT_WIDTH)
+    timings = []
+    with torch.inference_mode():
+        model(sample)
+        for _ in range(runs):
+            start = time.perf_counter()
+            model(sample)
+            timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, 50), np.percentile(timings, 99)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default='../data/handwriting', help='one folder of photos per phrase')
+    parser.add_argument('--output', default=HANDWRITING_MODEL_PATH)
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--lr', type=float, default=1e-3)
+    parser.add_argument('--val-split', type=float, default=0.2)
+    args = parser.parse_args()
+
+    inputs, labels, classes = load_dataset(args.data)
+    print(f"Loaded {len(labels)} photos of {len(classes)} classes: {classes}")
+    model, accuracy = train(inputs, labels, classes, args.epochs, args.batch_size, args.lr, args.val_split)
+    torch.save({'classes': classes, 'state_dict': model.state_dict()}, args.output)
+
+    p50, p99 = time_model(model)
+    print(f"Saved handwriting model to {args.output} ({os.path.getsize(args.output) / 1e6:.2f} MB), "
+          f"best val accuracy {accuracy:.3f}, CPU latency p50 {p50:.1f} ms / p99 {p99:.1f} ms")
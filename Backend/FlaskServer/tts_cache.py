@@ -0,0 +1,201 @@
+from collections import OrderedDict
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+
+class AudioCache:
+    """
+    Disk-backed, content-addressed cache for rendered audio.
+
+    Files are named after a hash of everything that affects the rendered audio, written
+    atomically (temp file + os.replace) so a reader never sees a half-written mp3, and
+    evicted least-recently-used first once the folder grows past max_bytes.
+    """
+    # temp files untouched for this long are treated as abandoned and removed on startup
+    STALE_PART_SECONDS = 3600
+
+    def __init__(self, folder, max_bytes, extension='.mp3'):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        # key -> size in bytes, oldest first
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self._load_index()
+
+    @staticmethod
+    def make_key(*parts):
+        """
+        Hashes the parts that identify a rendering, e.g. (text, voice_id, model_id, output_format).
+        """
+        return hashlib.sha256('\x1f'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.folder, key + self.extension)
+
+    def get(self, key):
+        """
+        Returns the cached file path for key, or None on a miss.
+        """
+        path = self.path_for(key)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            elif os.path.exists(path):
+                # written by another worker process
+                self._add(key, os.path.getsize(path))
+            else:
+                return None
+        try:
+            os.utime(path)  # keeps LRU order across restarts
+        except FileNotFoundError:
+            # evicted by another worker process in the meantime
+            with self._lock:
+                self._remove(key)
+            return None
+        return path
+
+    def put(self, key, chunks):
+        """
+        Atomically writes an iterable of byte chunks under key and returns its path.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    if chunk:
+                        f.write(chunk)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return self._commit(key, tmp_path)
+
+    def get_or_create(self, key, render):
+        """
+        Returns the cached path for key, calling render() (an iterable of byte chunks)
+        on a miss. Concurrent misses for the same key only render once.
+        """
+        path = self.get(key)
+        if path is not None:
+            return path
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                path = self.get(key)
+                if path is None:
+                    path = self.put(key, render())
+        finally:
+            with self._lock:
+                self._key_locks.pop(key, None)
+        return path
+
+    def stream(self, key, render):
+        """
+        Generator that yields render()'s byte chunks as they arrive while also writing
+        them to the cache, so a caller can forward audio before the render has finished.
+        The file is only committed once every chunk has been read; if the consumer stops
+        early (e.g. the client disconnected) the partial file is thrown away.
+
+        If another thread is already rendering key, waits for that render and yields the
+        finished file instead of starting a second one.
+        """
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        if not key_lock.acquire(blocking=False):
+            yield from self._read(self.get_or_create(key, render))
+            return
+
+        try:
+            path = self.get(key)
+            if path is not None:
+                yield from self._read(path)
+                return
+
+            fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix='.part')
+            complete = False
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in render():
+                        if chunk:
+                            f.write(chunk)
+                            yield chunk
+                complete = True
+            finally:
+                if complete:
+                    self._commit(key, tmp_path)
+                elif os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        finally:
+            key_lock.release()
+            with self._lock:
+                self._key_locks.pop(key, None)
+
+    @staticmethod
+    def _read(path, chunk_size=64 * 1024):
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def _commit(self, key, tmp_path):
+        path = self.path_for(key)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._remove(key)
+            self._add(key, os.path.getsize(path))
+            self._evict(keep=key)
+        return path
+
+    def _load_index(self):
+        files = []
+        now = time.time()
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            try:
+                if name.endswith('.part'):
+                    # left behind by an interrupted write; recent ones may still be in the middle
+                    # of being written by another worker sharing the folder, so leave those alone
+                    if now - os.stat(path).st_mtime > self.STALE_PART_SECONDS:
+                        os.remove(path)
+                elif name.endswith(self.extension):
+                    stat = os.stat(path)
+                    files.append((stat.st_mtime, name[:-len(self.extension)], stat.st_size))
+            except FileNotFoundError:
+                # committed, evicted or cleaned up by another worker meanwhile
+                continue
+        for _, key, size in sorted(files):
+            self._add(key, size)
+        self._evict()
+
+    def _add(self, key, size):
+        self._entries[key] = size
+        self._total_bytes += size
+
+    def _remove(self, key):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self, keep=None):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            self._remove(key)
+            try:
+                os.remove(self.path_for(key))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,40 @@
+from dotenv import load_dotenv
+import os
+import shutil
+import tempfile
+
+load_dotenv()
+
+# uploads up to this size stay in memory, larger ones roll over to an anonymous temp file
+UPLOAD_SPOOL_MAX_BYTES = int(os.getenv('UPLOAD_SPOOL_MAX_BYTES', str(1024 * 1024)))
+
+
+def spool_upload(file_storage, max_size=UPLOAD_SPOOL_MAX_BYTES):
+    """
+    Copies a werkzeug upload into a SpooledTemporaryFile. Nothing is written under static/,
+    and a rolled-over file has no name and is gone once closed, so concurrent uploads
+    cannot collide. The copy outlives the request, which lets it be handed to a background
+    job; whoever ends up with it must close it.
+
+    :param file_storage: An entry of request.files.
+    :return: The spooled file, positioned at the start.
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=max_size)
+    try:
+        shutil.copyfileobj(file_storage.stream, spooled)
+        spooled.seek(0)
+    except BaseException:
+        spooled.close()
+        raise
+    return spooled
+
+
+def upload_filename(file_storage, default='audio.m4a'):
+    """
+    Name to send an upload to a transcription API under. Only the client's extension is
+    kept, since the API uses it to detect the format.
+    """
+    extension = os.path.splitext(file_storage.filename or '')[1].lower()
+    if not extension:
+        return default
+    return 'upload' + extension
@@ -0,0 +1,150 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+import os
+import threading
+import time
+
+load_dotenv()
+
+
+class ServiceError(ValueError):
+    """
+    Raised when an external AI call cannot be completed. Subclasses ValueError because
+    that is what the routes already catch for failed vendor calls.
+    """
+
+
+class ServiceTimeout(ServiceError):
+    pass
+
+
+class ServiceUnavailable(ServiceError):
+    pass
+
+
+class ServiceExecutor:
+    """
+    Runs blocking calls to one external service on its own bounded thread pool.
+
+    - at most max_concurrency calls are in flight, so a slow vendor ties up this pool
+      instead of every request thread;
+    - callers wait at most timeout seconds (queueing included), and the call itself can
+      read remaining() to give the vendor SDK the same deadline, so an abandoned attempt
+      gives its pool slot back instead of holding it until the HTTP request gives up;
+    - after failure_threshold consecutive failures the circuit opens and calls fail fast
+      for reset_after seconds, then a single trial call is let through;
+    - with hedge_after set, a second identical attempt is started if the first has not
+      finished after hedge_after seconds and whichever finishes first wins. Only use
+      this for idempotent calls.
+    """
+
+    def __init__(self, name, max_concurrency=4, timeout=30.0, failure_threshold=5, reset_after=30.0, hedge_after=None):
+        self.name = name
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.hedge_after = hedge_after
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f'{name}-call')
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls, name, **defaults):
+        """
+        Builds an executor configured by <NAME>_MAX_CONCURRENCY, <NAME>_TIMEOUT,
+        <NAME>_FAILURE_THRESHOLD, <NAME>_RESET_AFTER and <NAME>_HEDGE_AFTER.
+        """
+        prefix = name.upper()
+        options = dict(defaults)
+        for option, cast in (('max_concurrency', int), ('timeout', float), ('failure_threshold', int),
+                             ('reset_after', float), ('hedge_after', float)):
+            value = os.getenv(f'{prefix}_{option.upper()}')
+            if value:
+                options[option] = cast(value)
+        return cls(name, **options)
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Runs fn(*args, **kwargs) under this service's limits and returns its result.
+        """
+        self._before_call()
+        deadline = time.monotonic() + self.timeout
+        attempts = [self._executor.submit(self._run, deadline, fn, args, kwargs)]
+        try:
+            result = self._wait(attempts, deadline, fn, args, kwargs)
+        except Exception:
+            self._record(success=False)
+            raise
+        self._record(success=True)
+        return result
+
+    def remaining(self):
+        """
+        Seconds left before the deadline of the call running on this thread, for use as
+        the vendor SDK's own request timeout. Outside a call it is the full timeout.
+        """
+        deadline = getattr(self._local, 'deadline', None)
+        if deadline is None:
+            return self.timeout
+        # never 0, which some HTTP clients read as "no timeout"
+        return max(deadline - time.monotonic(), 0.1)
+
+    def _run(self, deadline, fn, args, kwargs):
+        self._local.deadline = deadline
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._local.deadline = None
+
+    def _wait(self, attempts, deadline, fn, args, kwargs):
+        if self.hedge_after is not None:
+            done, _ = wait(attempts, timeout=min(self.hedge_after, max(deadline - time.monotonic(), 0)))
+            if not done and time.monotonic() < deadline:
+                attempts.append(self._executor.submit(self._run, deadline, fn, args, kwargs))
+
+        errors = []
+        pending = set(attempts)
+        while pending:
+            done, pending = wait(pending, timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for attempt in done:
+                if attempt.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return attempt.result()
+                errors.append(attempt.exception())
+
+        for attempt in pending:
+            attempt.cancel()
+        if errors:
+            raise ServiceError(f"{self.name} call failed: {errors[-1]}") from errors[-1]
+        raise ServiceTimeout(f"{self.name} call timed out after {self.timeout}s")
+
+    def _before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_after or self._trial_running:
+                raise ServiceUnavailable(f"{self.name} is unavailable after repeated failures, try again later")
+            # half open: let one trial call decide whether to close the circuit
+            self._trial_running = True
+
+    def _record(self, success):
+        with self._lock:
+            self._trial_running = False
+            if success:
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+whisper_service = ServiceExecutor.from_env('whisper', max_concurrency=4, timeout=30.0, hedge_after=None)
+vision_service = ServiceExecutor.from_env('vision', max_concurrency=4, timeout=45.0, hedge_after=None)
+tts_service = ServiceExecutor.from_env('tts', max_concurrency=8, timeout=20.0, hedge_after=None)
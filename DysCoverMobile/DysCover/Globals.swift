@@ -10,4 +10,6 @@ import Foundation
 // Global variable accessible throughout the app
 var globalUsername: String = ""
 var globalClassName: String = ""
+// Id of the test in progress, returned by /start and sent back with every test request
+var globalSessionId: String = ""
 
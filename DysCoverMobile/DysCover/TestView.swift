@@ -14,6 +14,7 @@ class BackendManager {
         }
         var request = URLRequest(url: url)
         request.httpMethod = "GET"
+        addSessionHeader(to: &request)
         URLSession.shared.dataTask(with: request) { data, _, error in
             if let error = error {
                 print("GET request error (\(route)): \(error)")
@@ -26,30 +27,45 @@ class BackendManager {
     
     // Generic POST request (for submitting answers or starting/finishing tests)
     static func postRequest(route: String, payload: [String: Any], completion: @escaping (Bool) -> Void) {
+        postRequestWithResponse(route: route, payload: payload) { data in
+            completion(data != nil)
+        }
+    }
+    
+    // POST request that hands back the response body (nil on failure)
+    static func postRequestWithResponse(route: String, payload: [String: Any], completion: @escaping (Data?) -> Void) {
         guard let url = URL(string: baseURL + route) else {
-            completion(false)
+            completion(nil)
             return
         }
         var request = URLRequest(url: url)
         request.httpMethod = "POST"
+        addSessionHeader(to: &request)
         do {
             request.httpBody = try JSONSerialization.data(withJSONObject: payload, options: [])
             request.setValue("application/json", forHTTPHeaderField: "Content-Type")
         } catch {
             print("Error serializing JSON for \(route): \(error)")
-            completion(false)
+            completion(nil)
             return
         }
-        URLSession.shared.dataTask(with: request) { _, _, error in
+        URLSession.shared.dataTask(with: request) { data, _, error in
             if let error = error {
                 print("POST request error (\(route)): \(error)")
-                completion(false)
+                completion(nil)
                 return
             }
-            completion(true)
+            completion(data ?? Data())
         }.resume()
     }
     
+    // Tells the server which test a request belongs to, so concurrent tests stay separate
+    static func addSessionHeader(to request: inout URLRequest) {
+        if !globalSessionId.isEmpty {
+            request.setValue(globalSessionId, forHTTPHeaderField: "X-Session-Id")
+        }
+    }
+    
     // fetchAudio is the same as getRequest.
     static func fetchAudio(route: String, completion: @escaping (Data?) -> Void) {
         getRequest(route: route, completion: completion)
@@ -296,10 +312,14 @@ struct TestView: View {
         isLoading = true
         let payload = ["username": globalUsername, "classname": globalClassName]
         
-        BackendManager.postRequest(route: "/start", payload: payload) { success in
+        BackendManager.postRequestWithResponse(route: "/start", payload: payload) { data in
+            let sessionId = data
+                .flatMap { try? JSONSerialization.jsonObject(with: $0) as? [String: Any] }
+                .flatMap { $0["session_id"] as? String }
             DispatchQueue.main.async {
                 self.isLoading = false
-                if success {
+                if let sessionId = sessionId {
+                    globalSessionId = sessionId
                     print("Test started for \(globalUsername) Class \(globalClassName)")
                     withAnimation {
                         self.didBeginTest = true
@@ -318,6 +338,7 @@ struct TestView: View {
             DispatchQueue.main.async {
                 if success {
                     print("Finish test POST succeeded.")
+                    globalSessionId = ""
                     finishTestCompleted = true
                 } else {
                     print("Finish test POST failed.")
@@ -619,6 +640,7 @@ struct QuestionThreeSectionView: View {
         }
         var request = URLRequest(url: url)
         request.httpMethod = "POST"
+        BackendManager.addSessionHeader(to: &request)
         
         let boundary = "Boundary-\(UUID().uuidString)"
         request.setValue("multipart/form-data; boundary=\(boundary)", forHTTPHeaderField: "Content-Type")
@@ -741,6 +763,7 @@ struct WaveformSectionView: View {
         }
         var request = URLRequest(url: url)
         request.httpMethod = "POST"
+        BackendManager.addSessionHeader(to: &request)
         
         let boundary = "Boundary-\(UUID().uuidString)"
         request.setValue("multipart/form-data; boundary=\(boundary)", forHTTPHeaderField: "Content-Type")
@@ -927,6 +950,7 @@ struct HandwritingSectionView: View {
         }
         var request = URLRequest(url: url)
         request.httpMethod = "POST"
+        BackendManager.addSessionHeader(to: &request)
         
         let boundary = "Boundary-\(UUID().uuidString)"
         request.setValue("multipart/form-data; boundary=\(boundary)", forHTTPHeaderField: "Content-Type")
@@ -1,23 +1,32 @@
 from flask import Flask, render_template, request, g, redirect, url_for
-import sqlite3
+import os
+import sys
+
+# the dashboard shares the backend's database layer
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../Backend/FlaskServer'))
+from Database.db_pool import ConnectionPool
+from Database.migrations import migrate_database
 
 app = Flask(__name__)
 DATABASE = "../Backend/FlaskServer/Database/user_data.sqlite"
+# the dashboard may be started before the backend has ever run
+migrate_database(DATABASE)
+db_pool = ConnectionPool(DATABASE)
 
 DIFFICULTY_LEVELS = ["easy", "medium", "hard"]
 
 def get_db():
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row  # enables dict-like row access in templates
+        # pooled connections return dict-like sqlite3.Row rows for the templates
+        db = g._database = db_pool.acquire()
     return db
 
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, '_database', None)
+    db = g.pop('_database', None)
     if db is not None:
-        db.close()
+        db_pool.release(db)
 
 # Teacher Dashboard: Enter class name and view all students in that class.
 @app.route("/", methods=["GET", "POST"])
@@ -37,16 +46,15 @@ def index():
 @app.route("/user/<username>")
 def user_dashboard(username):
     db = get_db()
-    cur = db.execute("SELECT * FROM data WHERE username = ?", (username,))
+    cur = db.execute("SELECT * FROM data WHERE username = ? ORDER BY test_id", (username,))
     records = cur.fetchall()
 
+    user = db.execute("SELECT difficulty_level FROM users WHERE username = ?", (username,)).fetchone()
+    difficulty = DIFFICULTY_LEVELS[user['difficulty_level']] if user else 'easy'
+
     # Aggregate metrics and collect chart data if there are test records.
     if records:
         count = len(records)
-        difficulty = 'easy'
-        if count > 0:
-            difficulty = records[0]['difficulty_level']
-            difficulty = DIFFICULTY_LEVELS[difficulty]
         
         total_score_sum = sum(row['total_score'] for row in records if row['total_score'] is not None)
         spelling_sum = sum(row['spelling_accuracy'] for row in records if row['spelling_accuracy'] is not None)
@@ -80,7 +88,10 @@ def update_user_difficulty(username):
     difficulty = difficulty.lower()
     difficulty_level = DIFFICULTY_LEVELS.index(difficulty)
     db = get_db()
-    db.execute("UPDATE data SET difficulty_level = ? WHERE username = ?", (difficulty_level, username))
+    db.execute("""
+        INSERT INTO users (username, difficulty_level) VALUES (?, ?)
+        ON CONFLICT (username) DO UPDATE SET difficulty_level = excluded.difficulty_level
+    """, (username, difficulty_level))
     db.commit()
     return redirect(url_for("user_dashboard", username=username))
 